@@ -27,17 +27,24 @@ from pyomo.core import Var
 import time
 import numpy as np
 import LP as optim
+import solvers
+import aging
+import result_writer
 import math
 import pickle
 import sys
 import glob
 from functools import wraps
 import csv
+import sqlite3
 import os
 import tempfile
+import io
 import post_proc as pp
 import matplotlib.pyplot as plt
 import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
 def fn_timer(function):
     @wraps(function)
@@ -57,69 +64,138 @@ def Get_output(instance):
 	with the desired names.
     Parameters
     ----------
-    instance : instance of pyomo
+    instance : instance of pyomo, a block of LP.Batch_model or LP.Sparse_model
     Returns
     -------
     df : DataFrame
     P_max_ : vector of daily maximum power
     '''
-    #to write in a csv goes faster than actualize a df
-    global_lock = threading.Lock()
-    while global_lock.locked():
-        continue
-    global_lock.acquire()
-    np.random.seed()
-    filename='out'+str(np.random.randint(1, 10, 10))[1:-1].replace(" ", "")+'.csv'
-    with open(filename, 'a') as f:
-        writer = csv.writer(f, delimiter=';')
-        for v in instance.component_objects(Var, active=True):
-          varobject = getattr(instance, str(v))
-          for index in varobject:
-              if str(v) =='P_max_day':
-                  P_max_=(v[index].value)
-              else:
-                  writer.writerow([index, varobject[index].value, v])
-    df=pd.read_csv(filename,sep=';',names=['val','var'])
-    os.remove(filename)
-    global_lock.release()
-    df=df.pivot_table(values='val', columns='var',index=df.index)
-    df=df.drop(-1)
-    #print(filename)
+    if isinstance(instance,optim.Sparse_model):
+        return instance.Get_output()
+    #the values are read straight into one column per variable (without the
+    #initial state of SOC), the variables not created by a specialized
+    #instance stay at 0
+    names=sorted(optim.Vars)
+    time=list(instance.Time)
+    out=np.zeros((len(time),len(names)))
+    for j,name in enumerate(names):
+        v=instance.component(name)
+        if v is not None and v.ctype is Var:
+            out[:,j]=np.array([v[t].value for t in time],dtype=float)
+    df=pd.DataFrame(out,columns=names)
+    P_max_=instance.P_max_day.value
     return [df,P_max_]
-@fn_timer
-def Optimize(data_input,param):
-    """
-    This function calls the LP and controls the aging. The aging is then
-    calculated in daily basis and the capacity updated. When the battery
-    reaches the EoL the loop breaks. 'days' allows to optimize multiple days at once.
+def Solve_LP_first(instance,solve):
+    '''
+    Solves the LP relaxation of the instance (without the exclusivity of the
+    flows) and checks the exclusivity on its solution. If it holds the
+    relaxation is also the optimum of the MILP, otherwise the MILP is solved.
+    Parameters
+    ----------
+    instance : instance of pyomo or LP.Sparse_model
+    solve : function solving the instance and returning the results
+    Returns
+    -------
+    results : SolverResults
+    milp : bool, True if the MILP had to be solved
+    '''
+    optim.Relax_model(instance)
+    results=solve()
+    optim.Relax_model(instance,False)
+    if ((results.solver.status==SolverStatus.ok)
+        and (results.solver.termination_condition==TerminationCondition.optimal)
+        and optim.Exclusivity_violations(instance)==0):
+        optim.Set_booleans(instance)
+        return [results,False]
+    return [solve(),True]
 
+def Set_start(instance,starts,repair=False):
+    '''
+    Sets the warm start of every block of the instance (see LP.Warm_start).
+    A start not satisfying the constraints (e.g. the SOC of the previous day
+    once the aging changed SOC_max, or the FC bounds of another FC_div) is
+    only given to the solvers repairing MIP starts (CPLEX, see
+    solvers.Solver), the others would discard it.
     Parameters
     ----------
-    Capacity : float
-    Tech : string
-    App_comb : array
-    Capacity_tariff : float
-    data_input: DataFrame
-    param: dict
-    PV_nom: float
+    instance : instance of pyomo
+    starts : list, solution of every block (see LP.Solution) or None
+    repair : bool, True if the solver repairs infeasible starts
+    Returns
+    -------
+    feasible : bool, True if the start satisfies every constraint
+    given : bool, True if the start is to be given to the solver
+    '''
+    feasible=True
+    for block,start in zip(optim.Blocks(instance),starts):
+        if start is None:
+            feasible=False
+        elif not optim.Warm_start(block,start):
+            feasible=False
+    return [feasible,feasible or (repair and any(start is not None for start in starts))]
+
+#Solutions of the last windows optimized by the process, used as warm start
+#when the same window of the same dwelling is optimized again
+Starts={}
+Starts_size=731
+
+def Start_key(param,i,w):
+    '''
+    Key of the window of w days starting at day i in Starts. The key does not
+    include the parameters changed by the sweeps (FC_div, Tech, Capacity...)
+    so that the solution of a previous run is the start of the next one.
+    '''
+    return (param.get('name'),i,w,tuple(param['App_comb']),param['delta_t'])
 
+def Store_start(key,solution):
+    '''
+    Stores the solution of a window in Starts, the oldest windows are
+    dropped beyond Starts_size.
+    '''
+    Starts.pop(key,None)
+    Starts[key]=solution
+    while len(Starts)>Starts_size:
+        del Starts[next(iter(Starts))]
+
+def Day_cost(df_1,param,rows):
+    '''
+    Bill of one day of a multi-day window, calculated as in LP.Obj_fcn with
+    the daily peak for the capacity tariff.
+    Parameters
+    ----------
+    df_1 : DataFrame, output of the day
+    param: dict, input of the window
+    rows : array, time steps of the day in the window
     Returns
     -------
-    df : DataFrame
-    aux_Cap_arr : array
-    SOH_arr : array
-    Cycle_aging_factor : array
-    P_max_arr : array
-    results_arr : array
-    cycle_cal_arr : array
-    DoD_arr : array
-    """
+    cost : float
+    '''
+    price=lambda k: np.asarray(param[k])[rows]
+    App=param['App_comb']
+    ie=param['Inverter_eff']
+    energy=(price('retail_price')*df_1.E_cons.values
+            -price('Export_price')*(df_1.E_PV_grid.values+df_1.E_dis_FC.values*ie)).sum()
+    FC=(df_1.E_grid_batt_FC.values*price('FC_price_down')
+        +price('FC_price_up')*df_1.E_dis_FC.values*ie).sum()
+    return (energy*App[2]+df_1.E_cons.max()/param['delta_t']*param['Capacity_tariff']*App[4]
+            -FC*App[0])
 
-    days=1
-    dt=param['delta_t']
-    end_d=int(param['ndays']*24/dt)
-    window=int(24*days/dt)
-    print('%%%%%%%%% Optimizing %%%%%%%%%%%%%%%')
+def New_state(data_input,param):
+    '''
+    Battery and daily results of one dwelling along the optimization.
+    Parameters
+    ----------
+    data_input: DataFrame
+    param: dict
+    Returns
+    -------
+    state : dict
+    '''
+    offsets=Day_offsets(data_input,param)
+    if isinstance(data_input.index,pd.DatetimeIndex):
+        dayofyear=np.asarray(data_input.index[offsets[:-1]].dayofyear)
+    else:
+        dayofyear=np.arange(len(offsets)-1)%365+1
     if param['cases']==False:
         Batt=pc.Battery_tech(Capacity=param['Capacity'],Technology=param['Tech'])
         #print('###############')
@@ -133,124 +209,369 @@ def Optimize(data_input,param):
         #print(Batt.Technology)
         #print(Batt.case)
         #print(Batt.Efficiency)
-    aux_Cap_arr=np.zeros(param['ndays'])
-    SOC_max_arr=np.zeros(param['ndays'])
-    SOH_arr=np.zeros(param['ndays'])
-    P_max_arr=np.zeros(param['ndays'])
-    cycle_cal_arr=np.zeros(param['ndays'])
-    results_arr=[]
-    DoD_arr=np.zeros(param['ndays'])
-    aux_Cap=Batt.Capacity
-    SOC_max_=Batt.SOC_max
-    SOH_aux=1
-    for i in range(int(param['ndays']/days)):
-        print(i, end='')
-        if i==0:
-            aux_Cap_aged=Batt.Capacity
-            aux_SOC_max=Batt.SOC_max
-            SOH=1
-        else:
-            aux_Cap_aged=aux_Cap
-            aux_SOC_max=SOC_max_
-            SOH=SOH_aux
-        data_input_=data_input[data_input.index.dayofyear==data_input.index.dayofyear[0]+i]
-        if param['App_comb'][3]==True:#DLS
-            if param['App_comb'][4]==True:#DPS
-                retail_price_dict=dict(enumerate(data_input_.Price_DT_mod))
-            else:
-                retail_price_dict=dict(enumerate(data_input_.Price_DT))
+    return {'Batt':Batt,
+            'aux_Cap_arr':np.zeros(param['ndays']),
+            'SOC_max_arr':np.zeros(param['ndays']),
+            'SOH_arr':np.zeros(param['ndays']),
+            'P_max_arr':np.zeros(param['ndays']),
+            'cycle_cal_arr':np.zeros(param['ndays']),
+            'results_arr':[],
+            'DoD_arr':np.zeros(param['ndays']),
+            'aux_Cap':Batt.Capacity,
+            'SOC_max_':Batt.SOC_max,
+            'SOH_aux':1,
+            'SOC_init':Batt.SOC_min,
+            'Cycle_aging_factor':0,
+            'MILP_days':0,
+            'start':None,
+            'warm_starts':0,
+            'warm_accepted':0,
+            'warm_repaired':0,
+            'telemetry':[],
+            'out':None,
+            'columns':None,
+            'rows':0,
+            #all the time steps and the last day stored twice at the EoL
+            'max_rows':data_input.shape[0]+int(25/param['delta_t']),
+            'stop':False,
+            #the input is split in days only once (see Window_data)
+            'offsets':offsets,
+            'dayofyear':dayofyear,
+            'inputs':{col:data_input[col].to_numpy(dtype=float)
+                      for col in data_input.columns}}
+
+#Entries of the state of a dwelling (see New_state) saved in the checkpoints,
+#the battery and the inputs are built again from param and data_input
+Checkpoint_arrays=['aux_Cap_arr','SOC_max_arr','SOH_arr','P_max_arr',
+                   'cycle_cal_arr','DoD_arr']
+Checkpoint_scalars=['aux_Cap','SOC_max_','SOH_aux','SOC_init',
+                    'Cycle_aging_factor','MILP_days','warm_starts',
+                    'warm_accepted','warm_repaired','resolved_days','rows','stop']
+
+def Checkpoint_key(param):
+    '''
+    Combination of a checkpoint: the dwelling, the parameters of the sweeps
+    (see Main.expand_grid) and the ones changing the days optimized.
+    '''
+    name_comb=''.join("%i" % x for x in param['App_comb'])
+    name_conf=''.join("%i" % x for x in param['conf'])
+    days=param.get('window_days',1)
+    return ('%(name)s_%(Tech)s_%(App_comb)s_%(Cap)s_%(FC_div)s_%(cases)s_%(Scenario)s'
+            '_%(conf)s_%(delta_t)s_%(days)s_%(step)s'
+            %{'name':param.get('name'),'Tech':param['Tech'],'App_comb':name_comb,
+              'Cap':param['Capacity'],'FC_div':param['FC_div'],'cases':param['cases'],
+              'Scenario':param.get('Scenario'),'conf':name_conf,'delta_t':param['delta_t'],
+              'days':days,'step':param.get('window_step',days)})
+
+def Checkpoint_file(param):
+    '''
+    Checkpoint of the combination in the directory param['checkpoint'],
+    named after its key (see Checkpoint_key).
+    '''
+    return os.path.join(param['checkpoint'],'ckpt_%s.npz'%Checkpoint_key(param))
+
+def Save_checkpoint(state,param,day):
+    '''
+    Saves the state of the dwelling before day (the aging, the daily results
+    and the schedules stored so far) in a compressed numpy file. The file is
+    replaced only once written, a worker killed while saving leaves the
+    previous checkpoint.
+    Parameters
+    ----------
+    state : dict, see New_state
+    param: dict
+    day : int, first day not optimized yet
+    '''
+    Write_telemetry(state,param)
+    filename=Checkpoint_file(param)
+    os.makedirs(param['checkpoint'],exist_ok=True)
+    arrays={k:state[k] for k in Checkpoint_arrays}
+    arrays.update({k:state.get(k,0) for k in Checkpoint_scalars})
+    arrays.update(day=day,ndays=param['ndays'],key=Checkpoint_key(param),
+                  results_arr=np.asarray(state['results_arr'],dtype=float))
+    if state['out'] is not None:
+        arrays.update(out=state['out'][:state['rows']],columns=np.array(state['columns']))
+    with open(filename+'.tmp','wb') as f:
+        np.savez_compressed(f,**arrays)
+    os.replace(filename+'.tmp',filename)
+
+def Load_checkpoint(state,param):
+    '''
+    Restores the state of the dwelling from its checkpoint (see
+    Save_checkpoint) if there is one for the same combination and number of
+    days.
+    Parameters
+    ----------
+    state : dict, see New_state
+    param: dict
+    Returns
+    -------
+    day : int, first day to optimize (0 without checkpoint)
+    '''
+    filename=Checkpoint_file(param)
+    if not os.path.exists(filename):
+        return 0
+    with np.load(filename) as ckpt:
+        if ('key' not in ckpt or str(ckpt['key'])!=Checkpoint_key(param)
+            or int(ckpt['ndays'])!=param['ndays']):
+            print('Ignoring %s, saved for another combination'%filename)
+            return 0
+        for k in Checkpoint_arrays:
+            state[k]=ckpt[k].copy()
+        for k in Checkpoint_scalars:
+            state[k]=ckpt[k].item()
+        state['results_arr']=list(ckpt['results_arr'])
+        if 'out' in ckpt:
+            state['columns']=list(ckpt['columns'])
+            state['out']=np.zeros((state['max_rows'],len(state['columns'])),order='F')
+            state['out'][:state['rows']]=ckpt['out']
+        print('Resuming %s from day %i'%(filename,ckpt['day']))
+        return int(ckpt['day'])
+
+def Remove_checkpoint(param):
+    '''
+    Removes the checkpoint of a finished combination.
+    '''
+    if param.get('checkpoint') and os.path.exists(Checkpoint_file(param)):
+        os.remove(Checkpoint_file(param))
+
+#Columns of the telemetry file (see Telemetry_record), times in seconds
+Telemetry_columns=['name','Tech','App_comb','Capacity','FC_div','day','days',
+                   'build_s','solve_s','output_s','aging_s','milp',
+                   'termination','gap','nodes','objective']
+
+def Telemetry_record(param,day,days,times,milp,results):
+    '''
+    Record of the telemetry of one window (see Optimize).
+    Parameters
+    ----------
+    param: dict
+    day : int, first day of the window
+    days : int, days of the window kept
+    times : list, seconds to build the model, solve it, read the output and
+        age the battery
+    milp : bool
+    results : SolverResults
+
+    Returns
+    -------
+    record : list, see Telemetry_columns
+    '''
+    def number(x):
+        #bounds and nodes are undefined or 'infinite' (1e75 for CPLEX) if unknown
+        try:
+            x=float(x)
+        except (TypeError,ValueError):
+            return None
+        return x if abs(x)<1e20 else None
+    upper=number(results.problem.upper_bound)
+    lower=number(results.problem.lower_bound)
+    gap=None
+    if upper is not None and lower is not None:
+        gap='%.3g'%(abs(upper-lower)/max(abs(upper),1e-10))
+    nodes=number(results.solver.statistics.branch_and_bound.number_of_bounded_subproblems)
+    return ([param.get('name'),param['Tech'],''.join("%i" % x for x in param['App_comb']),
+             param['Capacity'],param['FC_div'],day,days]+['%.4f'%t for t in times]
+            +[int(milp),str(results.solver.termination_condition),gap,
+              None if nodes is None else int(nodes),upper])
+
+def Write_telemetry(state,param):
+    '''
+    Appends the telemetry records of the dwelling to the csv file
+    param['telemetry']. The file is created with its header at once: the
+    header is written to a temporary file linked to param['telemetry'] only
+    if it does not exist, the workers of a pool starting together write it
+    once and never append records to a file without header.
+    '''
+    if not param.get('telemetry') or not state['telemetry']:
+        return
+    filename=param['telemetry']
+    if not os.path.exists(filename):
+        tmp='%s.%i.tmp'%(filename,os.getpid())
+        with open(tmp,'w',newline='') as f:
+            csv.writer(f).writerow(Telemetry_columns)
+        try:
+            os.link(tmp,filename)
+        except FileExistsError:
+            pass
+        finally:
+            os.remove(tmp)
+    lines=io.StringIO()
+    csv.writer(lines).writerows(state['telemetry'])
+    #one write per dwelling, the processes of a pool can share the file
+    with open(filename,'a',newline='') as f:
+        f.write(lines.getvalue())
+    state['telemetry']=[]
+
+def Failed_telemetry(states,params,houses,day,times,milp,results):
+    '''
+    Logs the window where the optimization of the dwellings stopped.
+    '''
+    for h in houses:
+        if params[h].get('telemetry'):
+            states[h]['telemetry'].append(Telemetry_record(params[h],day,0,
+                                          times+[0,0],milp,results))
+            Write_telemetry(states[h],params[h])
+
+def Day_offsets(data_input,param):
+    '''
+    First time step of every day of data_input followed by the number of
+    time steps, the window of w days starting at day i is then the slice
+    offsets[i]:offsets[i+w]. The days follow the local date of the index
+    (92 or 100 time steps on the DST days, also across the new year), an
+    input without dates (e.g. the years tiled by Main) has days of 24/delta_t
+    time steps.
+    Parameters
+    ----------
+    data_input: DataFrame
+    param: dict
+    Returns
+    -------
+    offsets : array
+    '''
+    n=data_input.shape[0]
+    if isinstance(data_input.index,pd.DatetimeIndex):
+        day=data_input.index.normalize().asi8
+        return np.concatenate([[0],np.flatnonzero(np.diff(day))+1,[n]])
+    return np.append(np.arange(0,n,int(round(24/param['delta_t']))),n)
+
+def Window_data(data_input,param,state,i,w):
+    '''
+    Updates param with the input of the window of w days starting at day i.
+    The time series are views of the input arrays of the dwelling (see
+    New_state and Day_offsets), indexed from 0 as the time steps of the LP.
+    Parameters
+    ----------
+    data_input: DataFrame
+    param: dict
+    state : dict, see New_state
+    i : int
+    w : int
+    Returns
+    -------
+    Data : dict, input of the LP
+    day_w : array, day of the window of every time step
+    '''
+    offsets=state['offsets']
+    start,end=offsets[i],offsets[i+w]
+    for col,values in state['inputs'].items():
+        param[col]=values[start:end]
+    if param['App_comb'][3]==True:#DLS
+        if param['App_comb'][4]==True:#DPS
+            retail_price=param['Price_DT_mod']
         else:
-            if param['App_comb'][4]==True:
-                retail_price_dict=dict(enumerate(data_input_.Price_flat_mod))
-            else:
-                retail_price_dict=dict(enumerate(data_input_.Price_flat))
-        for col in data_input_.keys():
-            param.update({col:dict(enumerate(data_input_[col]))})
-        Set_declare=np.arange(-1,data_input_.shape[0])
-        #if i==0:
-#         print(param['FC_price_up'])
-       
-        
-        param.update({'dayofyear':data_input.index.dayofyear[0]+i,
-                      'SOC_max':aux_SOC_max,
-    		'Batt':Batt,
-    		'Set_declare':Set_declare,
-    		'retail_price':retail_price_dict,
-    		'App_comb_mod':dict(enumerate(param['App_comb']))})
-            #Max_inj is in kW
-        param['Max_inj']=param['Curtailment']*param['PV_nom']
-        #print(param)
-        #print(data_input.Export_price)
-        global_lock = threading.Lock()
-        while global_lock.locked():
-            continue
-        global_lock.acquire()
-        instance = optim.Concrete_model(param)
-        if sys.platform=='win32':
-            opt = SolverFactory('cplex')
-            opt.options["threads"]=1
-            opt.options["mipgap"]=0.01
-            opt.options["TimeLimit"] = 30
+            retail_price=param['Price_DT']
+    else:
+        if param['App_comb'][4]==True:
+            retail_price=param['Price_flat_mod']
         else:
-            opt = SolverFactory('cplex',executable='/opt/ibm/ILOG/'
-                            'CPLEX_Studio1271/cplex/bin/x86-64_linux/cplex')
-            opt.options["threads"]=1
-            opt.options["mipgap"]=0.01
-            opt.options["TimeLimit"] = 30
-        results = opt.solve(instance)#,tee=True)
-        global_lock.release()
-        #results.write(num=1)
+            retail_price=param['Price_flat']
+    Set_declare=np.arange(-1,end-start)
+    param.update({'dayofyear':state['dayofyear'][i],
+                  'SOC_max':state['SOC_max_'],
+                  'Batt':state['Batt'],
+                  'Set_declare':Set_declare,
+                  'retail_price':retail_price,
+                  'App_comb_mod':dict(enumerate(param['App_comb']))})
+    #Max_inj is in kW
+    param['Max_inj']=param['Curtailment']*param['PV_nom']
+    #the window starts where the kept days of the previous one ended
+    param['SOC_init']=min(state['SOC_init'],state['SOC_max_']*(1-optim.FC_div(param)))
+    #the capacity tariff is daily, the peak of the window is paid every day
+    if w>1:
+        Data=dict(param,Capacity_tariff=param['Capacity_tariff']*w)
+    else:
+        Data=param
+    day_w=np.repeat(np.arange(w),np.diff(offsets[i:i+w+1]))
+    return [Data,day_w]
 
-        if (results.solver.status == SolverStatus.ok) :#and (results.solver.termination_condition == TerminationCondition.optimal):#if more than 30s then it is not optimal, but still useful
+def Store_day(state,param,df_1,d,P_max,cost):
+    '''
+    Ages the battery with the schedule of day d and stores the daily results.
+    Parameters
+    ----------
+    state : dict, see New_state
+    param: dict
+    df_1 : DataFrame, output of the day
+    d : int
+    P_max : float
+    cost : float
+    Returns
+    -------
+    stop : bool, True if the battery reached its end of life
+    '''
+    Batt=state['Batt']
+    SOH=state['SOH_aux']
+    if param['aging']:
+        [state['SOC_max_'],state['aux_Cap'],state['SOH_aux'],state['Cycle_aging_factor'],
+         cycle_cal,DoD]=aging_day(df_1.E_char+df_1.E_char_FC,SOH,Batt.SOC_min,Batt,
+                                  state['aux_Cap'])
+        state['DoD_arr'][d]=DoD
+        state['cycle_cal_arr'][d]=cycle_cal
+    else:
+        state['DoD_arr'][d]=(df_1.E_dis+df_1.E_dis_FC).sum()/Batt.Capacity
+        state['cycle_cal_arr'][d]=0
+        state['Cycle_aging_factor']=0
+    state['P_max_arr'][d]=P_max
+    state['aux_Cap_arr'][d]=state['aux_Cap']
+    state['SOC_max_arr'][d]=state['SOC_max_']
+    state['SOH_arr'][d]=state['SOH_aux']
+    state['results_arr'].append(cost)
+    stop=False
+    if d==0:#initialize
+        Store_rows(state,df_1)
+    elif d==param['ndays']-1:#if we go until the end of the days
+        Store_rows(state,df_1)
+        if SOH<=0:
+            stop=True
+        if param['ndays']/365>Batt.Battery_cal_life:
+            stop=True
+    else:#if SOH or ndays are greater than the limit
+        Store_rows(state,df_1)
+        if SOH<=0:
+            Store_rows(state,df_1)
+            stop=True
+        elif d/365>Batt.Battery_cal_life:
+            Store_rows(state,df_1)
+            stop=True
+    return stop
 
-        # Do something when the solution is optimal and feasible
-            
-            [df_1,P_max]=Get_output(instance)
-            if param['aging']:
-                [SOC_max_,aux_Cap,SOH_aux,Cycle_aging_factor,cycle_cal,DoD]=aging_day(
-                df_1.E_char+df_1.E_char_FC,SOH,Batt.SOC_min,Batt,aux_Cap_aged)
-                DoD_arr[i]=DoD
-                cycle_cal_arr[i]=cycle_cal
-                P_max_arr[i]=P_max
-                aux_Cap_arr[i]=aux_Cap
-                SOC_max_arr[i]=SOC_max_
-                SOH_arr[i]=SOH_aux
-            else:
-                DoD_arr[i]=(df_1.E_dis+df_1.E_dis_FC).sum()/Batt.Capacity
-                cycle_cal_arr[i]=0
-                P_max_arr[i]=P_max
-                aux_Cap_arr[i]=aux_Cap
-                SOC_max_arr[i]=SOC_max_
-                SOH_arr[i]=SOH_aux
-                Cycle_aging_factor=0
-            results_arr.append(instance.total_cost())
-            if i==0:#initialize
-                df=pd.DataFrame(df_1)
-            elif i==param['ndays']-1:#if we go until the end of the days
-                df=df.append(df_1,ignore_index=True)
-                if SOH<=0:
-                    break
-                if param['ndays']/365>Batt.Battery_cal_life:
-                    break
-            else:#if SOH or ndays are greater than the limit
-                df=df.append(df_1,ignore_index=True)
-                if SOH<=0:
-                    df=df.append(df_1,ignore_index=True)
-                    end_d=df.shape[0]
-                    break
-                if i/365>Batt.Battery_cal_life:
-                    df=df.append(df_1,ignore_index=True)
-                    break
-        elif (results.solver.termination_condition == TerminationCondition.infeasible):
-            results.write(num=1)
-            # Do something when model is infeasible
-            print('Termination condition',results.solver.termination_condition)
-            return (None,None,None,None,None,None,None,None,results)
-        else:
-            results.write(num=1)
-            # Something else is wrong
-            print ('Solver Status is here: ',  results.solver.status)
-            return (None,None,None,None,None,None,None,None,results)
+def Store_rows(state,df_1):
+    '''
+    Copies the schedule of a day into the result buffer of the dwelling,
+    allocated at the first day with one column per output variable and
+    enough rows for all the days (see New_state). The DataFrame is built
+    only once by Output.
+    Parameters
+    ----------
+    state : dict, see New_state
+    df_1 : DataFrame, output of the day
+    '''
+    if state['out'] is None:
+        state['columns']=list(df_1.columns)
+        state['out']=np.zeros((state['max_rows'],len(df_1.columns)),order='F')
+    r=state['rows']
+    state['out'][r:r+df_1.shape[0]]=df_1[state['columns']].values
+    state['rows']=r+df_1.shape[0]
+
+def Output(data_input,param,state,results):
+    '''
+    Adds the inputs to the schedule of the dwelling and gathers the daily
+    results.
+    Parameters
+    ----------
+    data_input: DataFrame
+    param: dict
+    state : dict, see New_state
+    results : SolverResults of the last solve
+    Returns
+    -------
+    df : DataFrame
+    aux_dict : dict
+    '''
+    Write_telemetry(state,param)
+    dt=param['delta_t']
+    df=pd.DataFrame(state['out'][:state['rows']],columns=state['columns'])
     end_d=df.shape[0]
     df=pd.concat([df,data_input.loc[data_input.index[:end_d],['E_demand','E_PV','Export_price']].reset_index()],axis=1)
     if param['App_comb'][3]==True:#DLS
@@ -282,14 +603,448 @@ def Optimize(data_input,param):
     print(df.head())
     df.set_index('index',inplace=True)
     print('bf aux_dict')
-    aux_dict={'aux_Cap_arr':aux_Cap_arr,'SOH_arr':SOH_arr,'Cycle_aging_factor':Cycle_aging_factor,'P_max_arr':P_max_arr,
-              'results_arr':results_arr,'cycle_cal_arr':cycle_cal_arr,'DoD_arr':DoD_arr,'results':results}
+    aux_dict={'aux_Cap_arr':state['aux_Cap_arr'],'SOH_arr':state['SOH_arr'],
+              'Cycle_aging_factor':state['Cycle_aging_factor'],'P_max_arr':state['P_max_arr'],
+              'results_arr':state['results_arr'],'cycle_cal_arr':state['cycle_cal_arr'],
+              'DoD_arr':state['DoD_arr'],'results':results,'MILP_days':state['MILP_days'],
+              'warm_starts':state['warm_starts'],
+              'warm_accepted':state['warm_accepted'],
+              'warm_repaired':state['warm_repaired']}
     print('af aux dict')
     return (df,aux_dict)
+
+@fn_timer
+def Optimize(data_input,param):
+    """
+    This function calls the LP and controls the aging. The aging is then
+    calculated in daily basis and the capacity updated. When the battery
+    reaches the EoL the loop breaks.
+    param['window_days'] (default 1) allows to optimize multiple days at once,
+    only the first param['window_step'] days (default window_days) of every
+    window are kept and the next window starts from their last SOC (rolling
+    horizon with overlap). The aging, the results and P_max are still daily
+    and the capacity tariff is applied to the peak of the window.
+    If param['persistent'] is True the LP instance is built only once and
+    the daily data is pushed into its mutable parameters (see LP.Update_model).
+    param['specialized']=True only creates the components needed by the
+    App_comb (see LP.Concrete_model).
+    param['backend']='scipy' uses LP.Sparse_model (scipy.optimize.milp)
+    instead of Pyomo.
+    param['solver'] selects the solver of the Pyomo backend (see
+    solvers.Registry, default 'auto' takes the first one installed),
+    param['mipgap'] (default 0.01), param['time_limit'] (default 30 s) and
+    param['threads'] (default 1) apply to every solver.
+    The big-M of the complementarity constraints are computed every day from
+    the data (see LP.Big_M), param['tight_M']=False uses the former constant.
+    param['exclusivity']='sos1' models the exclusive flows with SOS1 sets
+    instead of booleans and big-M (requires a solver supporting SOS1).
+    If param['LP_first'] is True the LP relaxation is solved first and the
+    MILP only on the days where the relaxation charges and discharges (or
+    imports and exports...) at the same time (see Solve_LP_first), the number
+    of windows solved as MILP is returned in aux_dict['MILP_days'].
+    param['parallel_days']=N solves the days N at a time in parallel with a
+    predicted aging, without aging param['parallel']=True solves all the days
+    in parallel (see Optimize_parallel).
+    If param['warm_start'] is True every window starts from the solution of
+    the same window of a previous run (e.g. of a Tech, Capacity or FC_div
+    sweep of the same dwelling, see Starts) or else from the previous window
+    (see LP.Warm_start and Set_start). aux_dict['warm_starts'] counts the windows
+    with a start, aux_dict['warm_accepted'] those whose start was feasible,
+    i.e. given as is to the solver as first incumbent, and
+    aux_dict['warm_repaired'] the infeasible starts given to CPLEX to repair.
+    The other starts are not given. The warm start is not used with LP_first
+    (the MILP would start from the relaxation).
+    With param['telemetry'] (a csv file) one record per window is appended
+    to the file with the seconds spent building the model, solving it,
+    reading the output and aging the battery, the termination condition,
+    the relative MIP gap, the branch and bound nodes and the objective (see
+    Telemetry_record), e.g. to find the days reaching the time limit.
+    With param['checkpoint'] (a directory) the state of the run is saved every
+    param['checkpoint_days'] days (default 30, see Save_checkpoint), a run of
+    the same combination killed before the end resumes from the last
+    checkpoint. The checkpoint is removed at the end.
+
+    Parameters
+    ----------
+    Capacity : float
+    Tech : string
+    App_comb : array
+    Capacity_tariff : float
+    data_input: DataFrame
+    param: dict
+    PV_nom: float
+
+    Returns
+    -------
+    df : DataFrame
+    aux_Cap_arr : array
+    SOH_arr : array
+    Cycle_aging_factor : array
+    P_max_arr : array
+    results_arr : array
+    cycle_cal_arr : array
+    DoD_arr : array
+    """
+    if (param.get('parallel_days',0)>1
+        or (param.get('parallel',False) and not param['aging'])):
+        return Optimize_parallel(data_input,param)
+    return Optimize_batch([data_input],[param])[0]
+
+def Optimize_batch(data_inputs,params):
+    """
+    Optimizes several dwellings with the same structure (App_comb, Tech,
+    delta_t, ndays and dates) at once: every day the dwellings are gathered
+    in a block-diagonal instance (see LP.Batch_model) solved with a single
+    solver call, then each one is aged separately. A single dwelling is
+    solved as in Optimize (all the options of Optimize apply), a batch is
+    built every day with the Pyomo backend. A dwelling whose battery reaches
+    its EoL leaves the batch.
+
+    Parameters
+    ----------
+    data_inputs: list of DataFrame
+    params: list of dict
+
+    Returns
+    -------
+    list of (df,aux_dict), one per dwelling, see Optimize
+    """
+    param=params[0]
+    #param['window_days'] days are optimized at once and the first
+    #param['window_step'] days of the window are kept (rolling horizon)
+    days=param.get('window_days',1)
+    step=param.get('window_step',days)
+    dt=param['delta_t']
+    print('%%%%%%%%% Optimizing %%%%%%%%%%%%%%%')
+    states=[New_state(data_input,p) for data_input,p in zip(data_inputs,params)]
+    batch=len(states)>1
+    mipgap=param.get('mipgap',0.01)
+    time_limit=param.get('time_limit',30)
+    opt=None
+    if param.get('backend','pyomo')!='scipy' or batch:
+        #the solver is found once (see solvers.Solver), 'auto' takes the
+        #first installed of CPLEX, Gurobi, HiGHS, CBC and GLPK
+        opt=solvers.Solver(param.get('solver','auto'),mipgap,time_limit,
+                           param.get('threads',1))
+    #warm starts are only given to the pyomo solvers supporting them, with
+    #LP_first the MILP would start from the relaxation anyway
+    warm=(param.get('warm_start',False) and not param.get('LP_first',False)
+          and opt is not None and opt.warm_start)
+    instance_key=None
+    #with param['checkpoint'] (a directory) the state is saved every
+    #param['checkpoint_days'] days and a killed run resumes from there
+    checkpoint=param.get('checkpoint')
+    every=param.get('checkpoint_days',30)
+    #with param['telemetry'] (a csv file) the times of every stage and the
+    #solver statistics of every window are logged (see Telemetry_record)
+    telemetry=param.get('telemetry')
+    i=0
+    if checkpoint:
+        start=[Load_checkpoint(state,p) for state,p in zip(states,params)]
+        if len(set(start))==1:
+            i=start[0]
+        else:#all the dwellings of a batch resume from the same day
+            states=[New_state(data_input,p) for data_input,p in zip(data_inputs,params)]
+    saved=i
+    while i<param['ndays']:
+        print(i, end='')
+        t_build=time.perf_counter()
+        w=min(days,param['ndays']-i)
+        houses=[h for h in range(len(states)) if not states[h]['stop']]
+        if not houses:
+            break
+        Datas=[]
+        for h in houses:
+            [Data,day_w]=Window_data(data_inputs[h],params[h],states[h],i,w)
+            Datas.append(Data)
+        Data=Datas[0]
+        #print(param)
+        #print(data_input.Export_price)
+        if param.get('backend','pyomo')=='scipy' and not batch:
+            #The sparse backend is always persistent
+            if instance_key==optim.Model_key(Data):
+                instance.Update_model(Data)
+            else:
+                instance=optim.Sparse_model(Data)
+                instance_key=optim.Model_key(Data)
+            solve=lambda: instance.solve({'time_limit':time_limit,
+                                          'mip_rel_gap':mipgap})
+        else:
+            #With param['persistent'] the instance is built once per structure
+            #and only the data of the day is updated (see LP.Get_model), the
+            #structure changes e.g. on days with 92 or 100 time steps (DST).
+            if batch:
+                instance=optim.Batch_model(Datas)
+            elif param.get('persistent',False):
+                instance=optim.Get_model(Data)
+            else:
+                instance = optim.Concrete_model(Data)
+            given=False
+            if warm:
+                starts=[Starts.get(Start_key(params[h],i,w),states[h]['start'])
+                        for h in houses]
+                [feasible,given]=Set_start(instance,starts,opt.repair_start)
+                for h,start in zip(houses,starts):
+                    states[h]['warm_starts']+=start is not None
+                    states[h]['warm_accepted']+=feasible
+                    states[h]['warm_repaired']+=given and not feasible and start is not None
+            #an infeasible start is only given to the solvers repairing it
+            solve=lambda: opt.solve(instance,warmstart=given)#,tee=True)
+        t_solve=time.perf_counter()
+        if param.get('LP_first',False):
+            [results,milp]=Solve_LP_first(instance,solve)
+        else:
+            results=solve()
+            milp=True
+        t_solved=time.perf_counter()
+        #results.write(num=1)
+
+        if (results.solver.status == SolverStatus.ok) :#and (results.solver.termination_condition == TerminationCondition.optimal):#if more than 30s then it is not optimal, but still useful
+
+        # Do something when the solution is optimal and feasible
+            kept=min(step,w)
+            for h,block in zip(houses,optim.Blocks(instance)):
+                state=states[h]
+                state['MILP_days']+=milp
+                if warm:
+                    state['start']=optim.Solution(block)
+                    Store_start(Start_key(params[h],i,w),state['start'])
+                t_output=time.perf_counter()
+                [df_w,P_max]=Get_output(block)
+                t_aging=time.perf_counter()
+                for k in range(kept):
+                    #aging and results are daily, also for multi-day windows
+                    df_1=df_w[day_w==k].reset_index(drop=True)
+                    if w>1:
+                        P_max=df_1.E_cons.max()/dt
+                        cost=Day_cost(df_1,params[h],np.flatnonzero(day_w==k))
+                    else:
+                        cost=block.total_cost()
+                    if Store_day(state,params[h],df_1,i+k,P_max,cost):
+                        state['stop']=True
+                        break
+                if kept<w:
+                    state['SOC_init']=df_1.SOC.iloc[-1]
+                if telemetry:
+                    t_end=time.perf_counter()
+                    state['telemetry'].append(Telemetry_record(params[h],i,kept,
+                        [t_solve-t_build,t_solved-t_solve,t_aging-t_output,
+                         t_end-t_aging],milp,results))
+            i+=kept
+            if checkpoint and i-saved>=every and i<param['ndays']:
+                for h in range(len(states)):
+                    Save_checkpoint(states[h],params[h],i)
+                saved=i
+        elif (results.solver.termination_condition == TerminationCondition.infeasible):
+            results.write(num=1)
+            # Do something when model is infeasible
+            print('Termination condition',results.solver.termination_condition)
+            Failed_telemetry(states,params,houses,i,[t_solve-t_build,t_solved-t_solve],
+                             milp,results)
+            return [(None,None,None,None,None,None,None,None,results)]*len(states)
+        else:
+            Failed_telemetry(states,params,houses,i,[t_solve-t_build,t_solved-t_solve],
+                             milp,results)
+            results.write(num=1)
+            # Something else is wrong
+            print ('Solver Status is here: ',  results.solver.status)
+            return [(None,None,None,None,None,None,None,None,results)]*len(states)
+    for p in params:
+        Remove_checkpoint(p)
+    return [Output(data_input,p,state,results)
+            for data_input,p,state in zip(data_inputs,params,states)]
+#Instances and solvers kept by every process and thread of Optimize_parallel
+Day_cache=threading.local()
+
+def Solve_day(Data):
+    """
+    Solves the LP of one day with the options of Optimize (backend, solver,
+    persistent, LP_first...), in a worker of Optimize_parallel or in the main
+    process. The instances (if persistent) and the solver are kept by the
+    process (or thread) for the next days.
+
+    Parameters
+    ----------
+    Data : dict, input of the LP (see Window_data)
+
+    Returns
+    -------
+    df_1 : DataFrame, output of the day, None if not solved
+    P_max : float
+    cost : float
+    milp : bool, True if the MILP was solved (see Solve_LP_first)
+    results : SolverResults
+    times : list, seconds to build the model, solve it and read the output
+    """
+    t_build=time.perf_counter()
+    cache=Day_cache.__dict__
+    if Data.get('backend','pyomo')=='scipy':
+        sparse=cache.setdefault('sparse',{})
+        key=optim.Model_key(Data)
+        if key in sparse:
+            instance=sparse[key]
+            instance.Update_model(Data)
+        else:
+            instance=sparse[key]=optim.Sparse_model(Data)
+        solve=lambda: instance.solve({'time_limit':Data.get('time_limit',30),
+                                      'mip_rel_gap':Data.get('mipgap',0.01)})
+    else:
+        if Data.get('persistent',False):
+            instance=optim.Get_model(Data,cache.setdefault('templates',{}))
+        else:
+            instance=optim.Concrete_model(Data)
+        options=(Data.get('solver','auto'),Data.get('mipgap',0.01),
+                 Data.get('time_limit',30),Data.get('threads',1))
+        day_solvers=cache.setdefault('solvers',{})
+        if options not in day_solvers:
+            day_solvers[options]=solvers.Solver(*options)
+        opt=day_solvers[options]
+        solve=lambda: opt.solve(instance)
+    t_solve=time.perf_counter()
+    if Data.get('LP_first',False):
+        [results,milp]=Solve_LP_first(instance,solve)
+    else:
+        results=solve()
+        milp=True
+    t_output=time.perf_counter()
+    if results.solver.status!=SolverStatus.ok:
+        return [None,None,None,milp,results,[t_solve-t_build,t_output-t_solve,0]]
+    [df_1,P_max]=Get_output(instance)
+    return [df_1,P_max,instance.total_cost(),milp,results,
+            [t_solve-t_build,t_output-t_solve,time.perf_counter()-t_output]]
+
+def Predict_SOC_max(state,param,days):
+    """
+    SOC_max of the battery at the beginning of each of the next days,
+    extrapolated from the capacity lost per day in the last days (at least
+    the calendar aging).
+
+    Parameters
+    ----------
+    state : dict, see New_state
+    param : dict
+    days : array, days to predict (consecutive, after the last stored day)
+
+    Returns
+    -------
+    SOC_max : array
+    """
+    Batt=state['Batt']
+    if not param['aging']:
+        return np.full(len(days),state['SOC_max_'])
+    #calendar aging of one day (see aging.Calendar_aging)
+    rate=0.3*(Batt.SOC_max-Batt.SOC_min)*aging.Calendar_aging(Batt)
+    n=min(len(days),days[0])
+    if n>1:
+        past=state['SOC_max_arr'][days[0]-n:days[0]]
+        rate=max(rate,(past[0]-past[-1])/(n-1))
+    return state['SOC_max_']-rate*np.arange(len(days))
+
+def Optimize_parallel(data_input,param):
+    """
+    Optimizes one dwelling solving the days in parallel. The only dependency
+    between consecutive days is the aging of the battery (SOC_max), which is
+    slow: the SOC_max of the next param['parallel_days'] days is predicted
+    (see Predict_SOC_max), the days are solved in param['workers'] processes
+    (default all the cores) and then aged in order. A day whose predicted
+    SOC_max differs from the actual one by more than param['parallel_tol']
+    (relative, default 1e-4) is solved again. aux_dict['resolved_days']
+    counts the days solved again.
+    Without aging (param['aging']=False) the days are independent, all of
+    them are solved at once and merged in order (param['parallel']=True is
+    enough in this case).
+    param['parallel_pool']='thread' uses threads instead of processes, as
+    inside a daemonic worker (e.g. of the multiprocessing pool of Main) where
+    no process can be started. Threads are only used with the scipy backend
+    (HiGHS releases the GIL while solving), the Pyomo interfaces redirect the
+    output of the whole process while solving and the days are then solved
+    one after the other. Only daily windows are supported (window_days is
+    ignored).
+
+    Parameters
+    ----------
+    data_input: DataFrame
+    param: dict
+
+    Returns
+    -------
+    df : DataFrame
+    aux_dict : dict, see Optimize
+    """
+    print('%%%%%%%%% Optimizing in parallel %%%%%%%%%%%%%%%')
+    if param['aging']:
+        block=param['parallel_days']
+    else:
+        block=param['ndays']
+    tol=param.get('parallel_tol',1e-4)
+    workers=param.get('workers',os.cpu_count())
+    state=New_state(data_input,param)
+    state['resolved_days']=0
+    if (param.get('parallel_pool','process')=='process'
+        and not multiprocessing.current_process().daemon):
+        pool=ProcessPoolExecutor(max_workers=workers)
+    elif param.get('backend','pyomo')=='scipy':
+        pool=ThreadPoolExecutor(max_workers=workers)
+    else:
+        #the pyomo interfaces redirect the output of the process while solving
+        print('No threads with pyomo, the days are solved sequentially')
+        pool=None
+    results=None
+    i=0
+    if param.get('checkpoint'):
+        i=Load_checkpoint(state,param)
+    saved=i
+    try:
+        while i<param['ndays'] and not state['stop']:
+            days=np.arange(i,min(i+block,param['ndays']))
+            print(i, end='')
+            SOC_max=Predict_SOC_max(state,param,days)
+            Datas=[Window_data(data_input,dict(param),dict(state,SOC_max_=SOC_max[k]),
+                               d,1)[0] for k,d in enumerate(days)]
+            if pool is None:
+                solved=map(Solve_day,Datas)
+            else:
+                #the days are sent in chunks to limit the communication
+                solved=pool.map(Solve_day,Datas,
+                                chunksize=max(1,len(Datas)//(4*workers)))
+            for k,(d,out) in enumerate(zip(days,solved)):
+                if abs(SOC_max[k]-state['SOC_max_'])>tol*state['SOC_max_']:
+                    #the aging of the previous days was not the predicted one
+                    out=Solve_day(Window_data(data_input,dict(param),state,d,1)[0])
+                    state['resolved_days']+=1
+                [df_1,P_max,cost,milp,results,times]=out
+                if df_1 is None:
+                    results.write(num=1)
+                    print('Termination condition',results.solver.termination_condition)
+                    Failed_telemetry([state],[param],[0],d,times[:2],milp,results)
+                    return (None,None,None,None,None,None,None,None,results)
+                state['MILP_days']+=milp
+                t_aging=time.perf_counter()
+                stop=Store_day(state,param,df_1,d,P_max,cost)
+                if param.get('telemetry'):
+                    state['telemetry'].append(Telemetry_record(param,d,1,
+                        times+[time.perf_counter()-t_aging],milp,results))
+                if stop:
+                    state['stop']=True
+                    break
+            i=days[-1]+1
+            if (param.get('checkpoint') and i-saved>=param.get('checkpoint_days',30)
+                and i<param['ndays']):
+                Save_checkpoint(state,param,i)
+                saved=i
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+    Remove_checkpoint(param)
+    [df,aux_dict]=Output(data_input,param,state,results)
+    aux_dict['resolved_days']=state['resolved_days']
+    return (df,aux_dict)
+
 def get_cycle_aging(DoD,Technology):
     '''
     The cycle aging factors are defined for each technology according
-	to the DoD using an exponential function close to the Woehler curve.
+	to the DoD using an exponential function close to the Woehler curve
+    (see aging.Woehler).
     Parameters
     ----------
     DoD : float
@@ -299,22 +1054,7 @@ def get_cycle_aging(DoD,Technology):
     -------
     Cycle_aging_factor : float
     '''
-    if Technology=='LTO':#Xalt 60Ah LTO Model F920-0006
-        Cycle_aging_factor=1/(math.exp((math.log(DoD)-math.log(771.51))/-0.604)-45300)#R2=.9977
-    elif Technology=='LFP':#https://doi.org/10.1016/j.apenergy.2013.09.003
-        Cycle_aging_factor=1/(math.exp((math.log(DoD)-math.log(70.869))/-0.54)+1961.37135)#R2=.917
-    elif Technology=='NCA':#Saft Evolion
-        #Cycle_aging_factor=1/(math.exp((math.log(DoD)-math.log(1216.7))/-0.869)-289.736058)#R2=.9675 SAFT
-        Cycle_aging_factor=1/(math.exp((math.log(DoD)-math.log(1216.7))/-0.869)+4449.67011)#TRINA BESS
-    elif Technology=='NMC':#Tesla Truong et al. 2016
-        Cycle_aging_factor=1/(math.exp((math.log(DoD)-math.log(1E8))/-2.168))
-    elif Technology=='ALA':#Sacred sun FCP-1000 lead carbon
-        Cycle_aging_factor=1/(math.exp((math.log(DoD)-math.log(37403))/-1.306)+330.656417)#R2=.9983
-    elif Technology=='VRLA':#Sonnenschein
-        Cycle_aging_factor=1/(math.exp((math.log(DoD)-math.log(667.61))/-.988))#R2=0.99995
-    elif Technology=='test':
-        Cycle_aging_factor=1/(math.exp((math.log(DoD)-math.log(238.86))/-0.875)+4482.74484)#R2=.961
-    return Cycle_aging_factor
+    return float(aging.Cycle_aging(DoD,Technology))
 
 def aging_day(daily_ESB,SOH,SOC_min,Batt,aux_Cap):
     """"
@@ -360,29 +1100,10 @@ def aging_day(daily_ESB,SOH,SOC_min,Batt,aux_Cap):
     cycle_cal : int
     DoD : float
     """
-    #aging is daily
-    Cal_aging_factor=1/(Batt.Battery_cal_life*24*365)
-    aux_DOD=(Batt.SOC_max-Batt.SOC_min)/Batt.Capacity
+    #aging is daily, see aging.Age_days for whole arrays of days
     DoD=daily_ESB.sum()/Batt.Capacity
-    if DoD==0:
-        Cycle_aging_factor=get_cycle_aging(DoD+0.00001,Batt.Technology)
-    elif DoD<=1:
-        Cycle_aging_factor=get_cycle_aging(DoD,Batt.Technology)
-    else:
-        aux_DoD=DoD-int(DoD)
-        Cycle_aging_factor=get_cycle_aging(aux_DoD,Batt.Technology)
-        for i in range(int(DoD)):
-            Cycle_aging_factor+=get_cycle_aging(1,Batt.Technology)
-    #Linearize SOH in [0,1]
-    #SOH=0 if EoL (70% CNom)
-    SOH=1/.3*aux_Cap/Batt.Capacity-7/3
-    aging=max(Cycle_aging_factor,Cal_aging_factor*24)
-    aux_Cap=Batt.Capacity*(1-0.3*(1-SOH+aging))
-    if Cycle_aging_factor>(Cal_aging_factor*24):
-        cycle_cal=1
-    else:
-        cycle_cal=0
-    SOC_max=Batt.SOC_min+aux_Cap*(aux_DOD)
+    [SOC_max,aux_Cap,SOH,Cycle_aging_factor,cycle_cal]=[
+        x.item() for x in aging.Age_days([DoD],Batt,aux_Cap)]
     return [SOC_max,aux_Cap,SOH,Cycle_aging_factor,cycle_cal,DoD]
 def Merge(dict1, dict2): 
     res = {**dict1, **dict2} 
@@ -426,23 +1147,20 @@ def aggregate_results(df,aux_dict,param):
         
         [agg_results]=pp.get_main_results(param,clusters,PV,App)
         print(agg_results.keys())
-        global_lock = threading.Lock()
-        while global_lock.locked():
-            continue
-        global_lock.acquire()
-        #Should be saved in a DB
-        filename='/data/home/alejandropena/P4/Sept_2021/Output/aggregated_results.csv'
+        #one row per combination in the results store, written by the
+        #writer process of Main (see result_writer)
         print('Inside agg_results')
-        with open(filename, 'a', newline='') as f:
-            writer = csv.writer(f, delimiter=';')
-            writer.writerow(agg_results.values)
-        global_lock.release()
+        result_writer.Send('aggregated',agg_results)
         print('aggregated saved')
 
     except IOError as e:
         print('Had some issues with the aggregated results')
         print ("I/O error({0}): {1}".format(e.errno, e.strerror))
 
+    except sqlite3.Error as e:
+        print('Had some issues with the aggregated results')
+        print ("Database error: {0}".format(e))
+
     except ValueError as b:
         print('Had some issues with the aggregated results')
         print ("Could not convert data to an integer." + str(b))
@@ -484,7 +1202,8 @@ def save_results(df,aux_dict,param):
         name_conf=col2[0]+col2[1]+col2[2]+col2[3]
         print('after')
         filename_save=('/data/home/alejandropena/P4/Sept_2021/Output/df_%(name)s_%(Tech)s_%(App_comb)s_%(Cap)s_%(conf)s_%(FC_div)s.csv'%{'name':param['name'],'Tech':param['Tech'],'App_comb':name_comb,'Cap':int(param['Capacity']),'conf':name_conf,'FC_div':param['FC_div']})
-        df.to_csv(filename_save)
+        #written by the writer process of Main (see result_writer)
+        result_writer.Send('csv',(filename_save,df))
         print('df_saved')
         save_obj(aux_dict, 'aux_dict' )
         print('aux_dict')
@@ -496,8 +1215,9 @@ def save_results(df,aux_dict,param):
         return
 
 def save_obj(obj, name ):
-    with open('/data/home/alejandropena/P4/Sept_2021/Output/'+ name + '.pkl', 'wb') as f:
-        pickle.dump(obj, f, pickle.HIGHEST_PROTOCOL)
+    #pickled by Send, the dictionaries are modified afterwards (see aggregate_results)
+    result_writer.Send('pickle',('/data/home/alejandropena/P4/Sept_2021/Output/'+ name + '.pkl',
+                                 obj))
 
 
 def single_opt2(param, data_input):
@@ -537,3 +1257,26 @@ def single_opt2(param, data_input):
     print('so3')
     return  [df,aux_dict]
 
+def batch_opt(params, data_inputs):
+    """"
+    Same as single_opt2 for a group of dwellings with the same structure,
+    optimized together (see Optimize_batch).
+    Parameters
+    ----------
+    params: list of dict
+    data_inputs: list of DataFrame
+
+    Returns
+    -------
+    list of [df,aux_dict]
+    """
+    print('@@@@@@@@@@@@@@@@@@@@@@@@@@')
+    print('batch opt')
+    aux_app_comb=[param['App_comb'] for param in params]
+    results=Optimize_batch(data_inputs,params)
+    for param,App_comb,(df,aux_dict) in zip(params,aux_app_comb,results):
+        param.update({'App_comb':App_comb})
+        save_results(df,aux_dict,param)
+        if param['testing']==False:
+            aggregate_results(df,aux_dict,param)
+    return [list(r) for r in results]
@@ -38,10 +38,62 @@
 
 
 import pyomo.environ as en
+from pyomo.opt import SolverResults, SolverStatus, TerminationCondition
+from pyomo.core.expr.visitor import identify_variables
+from pyomo.repn import generate_standard_repn
+import numpy as np
+import pandas as pd
+try:
+    import scipy.sparse as sp
+    from scipy.optimize import milp, Bounds, LinearConstraint
+except ImportError:#the sparse backend is optional
+    milp=None
+
+#Variables of the full instance (without P_max_day), i.e. the columns of the
+#daily output
+Vars=['Bool_inj','Bool_cons','Bool_char','Bool_dis','Bool_inv_out',
+      'Bool_inv_in','Bool_char_FC','Bool_dis_FC','Bool_FC_SC_dis',
+      'Bool_FC_SC_char','Bool_FC_SC_dis2','Bool_FC_SC_char2',
+      'E_PV_grid','E_PV_load','E_PV_batt','E_PV_curt','E_grid_load',
+      'E_grid_batt','E_PV_batt_FC','E_grid_batt_FC','E_batt_FC',
+      'E_loss_Batt','E_loss_Batt_FC','E_cons','E_char','E_dis',
+      'E_char_FC','E_dis_FC','SOC','SOC_FC','E_loss_inv_batt_FC',
+      'E_loss_conv','E_loss_inv','E_loss_inv_PV','E_loss_inv_batt',
+      'E_loss_inv_grid']
+
+#Mutually exclusive flows (Bool_a,Bool_b,flows_a,flows_b): the flows_a can
+#only be positive if Bool_a=1 and the flows_b if Bool_b=1, Bool_a+Bool_b=1
+Exclusive=[('Bool_inj','Bool_cons',['E_PV_grid','E_dis_FC'],['E_cons']),
+           ('Bool_char','Bool_dis',['E_char'],['E_dis']),
+           ('Bool_inv_out','Bool_inv_in',['E_PV_grid','E_PV_load','E_dis','E_dis_FC'],
+            ['E_grid_batt','E_grid_batt_FC']),
+           ('Bool_char_FC','Bool_dis_FC',['E_char_FC'],['E_dis_FC']),
+           ('Bool_FC_SC_char','Bool_FC_SC_dis',['E_char'],['E_dis_FC']),
+           ('Bool_FC_SC_char2','Bool_FC_SC_dis2',['E_char_FC'],['E_dis'])]
 
 #Model
-def Concrete_model(Data):
-    m = en.ConcreteModel()
+def Concrete_model(Data,m=None):
+    '''
+    Description
+    -------
+    Builds the daily instance, or populates the block m (see Batch_model). If Data['specialized'] is True only the
+    components needed by the application combination are created: without FC
+    the FC battery, its booleans and constraints are not created (and the whole
+    battery is used for the other applications, i.e. FC_div=0), without DLS
+    there is no grid charging of the battery, and without FC nor DLS the
+    inverter booleans are not needed. The flows that cannot happen are
+    declared as Params equal to zero so the rules are the same in both cases.
+    Data['exclusivity'] selects the formulation of the mutually exclusive
+    flows: 'bigM' (default) uses boolean pairs with big-M constraints, 'sos1'
+    uses SOS1 sets (see SOS_constraints) and no booleans are created.
+    '''
+    if m is None:
+        m = en.ConcreteModel()
+    specialized=Data.get('specialized',False)
+    sos=Data.get('exclusivity','bigM')=='sos1'
+    need_FC=(not specialized) or bool(Data['App_comb_mod'][0])
+    need_grid_batt=(not specialized) or bool(Data['App_comb_mod'][3])
+    need_inv=need_FC or need_grid_batt
 
     #Sets
 
@@ -49,83 +101,103 @@ def Concrete_model(Data):
     m.tm=en.Set(initialize=Data['Set_declare'],ordered=True)
 
     #Parameters
+    #Structural parameters, a change on them requires a new instance
     m.dt=en.Param(initialize=Data['delta_t'])
-    m.FC=en.Param(initialize=Data['App_comb_mod'][0])
-    m.PVAC=en.Param(initialize=Data['App_comb_mod'][1])
-    m.PVSC=en.Param(initialize=Data['App_comb_mod'][2])
-    m.DLS=en.Param(initialize=Data['App_comb_mod'][3])
-    m.DPS=en.Param(initialize=Data['App_comb_mod'][4])
-
-    m.retail_price=en.Param(m.Time,initialize=Data['retail_price'])
-    m.E_PV=en.Param(m.Time,initialize=Data['E_PV'])
-    m.E_demand=en.Param(m.Time,initialize=Data['E_demand'])
-    m.FC_price_up=en.Param(m.Time,initialize=Data['FC_price_up'])
-    m.FC_price_down=en.Param(m.Time,initialize=Data['FC_price_down'])
+    m.FC=en.Param(initialize=int(Data['App_comb_mod'][0]))
+    m.PVAC=en.Param(initialize=int(Data['App_comb_mod'][1]))
+    m.PVSC=en.Param(initialize=int(Data['App_comb_mod'][2]))
+    m.DLS=en.Param(initialize=int(Data['App_comb_mod'][3]))
+    m.DPS=en.Param(initialize=int(Data['App_comb_mod'][4]))
+    m.FC_div=en.Param(initialize=FC_div(Data))
+
+    #Mutable parameters, updated every day by Update_model
+    m.retail_price=en.Param(m.Time,initialize=Data['retail_price'],mutable=True)
+    m.E_PV=en.Param(m.Time,initialize=Data['E_PV'],mutable=True)
+    m.E_demand=en.Param(m.Time,initialize=Data['E_demand'],mutable=True)
+    m.FC_price_up=en.Param(m.Time,initialize=Data['FC_price_up'],mutable=True)
+    m.FC_price_down=en.Param(m.Time,initialize=Data['FC_price_down'],mutable=True)
     
 
 
-    m.export_price=en.Param(m.Time,initialize=Data['Export_price'])
-    m.capacity_tariff=en.Param(default=Data['Capacity_tariff'])
-    m.Inverter_power=en.Param(initialize=Data['Inv_power'])
-    m.Inverter_eff=en.Param(initialize=Data['Inverter_eff'])
-    m.Converter_eff=en.Param(initialize=Data['Converter_Efficiency_Batt'])
+    m.export_price=en.Param(m.Time,initialize=Data['Export_price'],mutable=True)
+    m.capacity_tariff=en.Param(initialize=Data['Capacity_tariff'],mutable=True)
+    m.Inverter_power=en.Param(initialize=Data['Inv_power'],mutable=True)
+    m.Inverter_eff=en.Param(initialize=Data['Inverter_eff'],mutable=True)
+    m.Converter_eff=en.Param(initialize=Data['Converter_Efficiency_Batt'],mutable=True)
 
-    m.Max_injection=en.Param(initialize=Data['Max_inj'])
-    m.SOC_init=en.Param(initialize=Data['Batt'].SOC_min)
-    m.Efficiency=en.Param(initialize=Data['Batt'].Efficiency)
+    m.Max_injection=en.Param(initialize=Data['Max_inj'],mutable=True)
+    m.SOC_init=en.Param(initialize=Data.get('SOC_init',Data['Batt'].SOC_min),mutable=True)
+    m.Efficiency=en.Param(initialize=Data['Batt'].Efficiency,mutable=True)
     
 
     #FC_related Parameters
-    m.FC_div=en.Param(initialize=Data['FC_div'])
-    m.SOC_min_FC=en.Param(initialize=Data['Batt'].SOC_min)
-    m.SOC_max_FC=en.Param(initialize=Data['SOC_max']*m.FC_div)
-    m.Batt_dis_max_FC=en.Param(initialize=-Data['Batt'].P_max_dis*m.FC_div)
-    m.Batt_char_max_FC=en.Param(initialize=Data['Batt'].P_max_char*m.FC_div)
+    m.SOC_min_FC=en.Param(initialize=Data['Batt'].SOC_min,mutable=True)
+    m.SOC_max_FC=en.Param(initialize=Data['SOC_max']*m.FC_div,mutable=True)
+    m.Batt_dis_max_FC=en.Param(initialize=-Data['Batt'].P_max_dis*m.FC_div,mutable=True)
+    m.Batt_char_max_FC=en.Param(initialize=Data['Batt'].P_max_char*m.FC_div,mutable=True)
     
-    m.SOC_min=en.Param(initialize=Data['Batt'].SOC_min)
-    m.SOC_max=en.Param(initialize=Data['SOC_max']*(1-m.FC_div))
-    m.Batt_dis_max=en.Param(initialize=-Data['Batt'].P_max_dis*(1-m.FC_div))
-    m.Batt_char_max=en.Param(initialize=Data['Batt'].P_max_char*(1-m.FC_div))
+    m.SOC_min=en.Param(initialize=Data['Batt'].SOC_min,mutable=True)
+    m.SOC_max=en.Param(initialize=Data['SOC_max']*(1-m.FC_div),mutable=True)
+    m.Batt_dis_max=en.Param(initialize=-Data['Batt'].P_max_dis*(1-m.FC_div),mutable=True)
+    m.Batt_char_max=en.Param(initialize=Data['Batt'].P_max_char*(1-m.FC_div),mutable=True)
+
+    #Big-M of the complementarity constraints (see Big_M)
+    if not sos:
+        M=Big_M(Data)
+        for name in M_names:
+            m.add_component(name,en.Param(m.Time,initialize=dict(enumerate(M[name])),
+                                          mutable=True))
     
     #Variables
-    m.Bool_inj=en.Var(m.Time,within=en.Boolean)
-    m.Bool_cons=en.Var(m.Time,within=en.Boolean,initialize=0)
+    if not sos:
+        m.Bool_inj=en.Var(m.Time,within=en.Boolean)
+        m.Bool_cons=en.Var(m.Time,within=en.Boolean,initialize=0)
     
-    m.Bool_char=en.Var(m.Time,within=en.Boolean)
-    m.Bool_dis=en.Var(m.Time,within=en.Boolean,initialize=0)
+        m.Bool_char=en.Var(m.Time,within=en.Boolean)
+        m.Bool_dis=en.Var(m.Time,within=en.Boolean,initialize=0)
     
-    m.Bool_inv_out=en.Var(m.Time,within=en.Boolean)#to DC/AC
-    m.Bool_inv_in=en.Var(m.Time,within=en.Boolean,initialize=0)# AC/DC
+    if need_inv and not sos:
+        m.Bool_inv_out=en.Var(m.Time,within=en.Boolean)#to DC/AC
+        m.Bool_inv_in=en.Var(m.Time,within=en.Boolean,initialize=0)# AC/DC
     
-    m.Bool_char_FC=en.Var(m.Time,within=en.Boolean)
-    m.Bool_dis_FC=en.Var(m.Time,within=en.Boolean,initialize=0)
-    # treated as two batts, but they cannot charge and discharge @ same time
-    m.Bool_FC_SC_dis=en.Var(m.Time,within=en.Boolean,initialize=0)
-    m.Bool_FC_SC_char=en.Var(m.Time,within=en.Boolean,initialize=0)
-    m.Bool_FC_SC_dis2=en.Var(m.Time,within=en.Boolean,initialize=0)
-    m.Bool_FC_SC_char2=en.Var(m.Time,within=en.Boolean,initialize=0)
+    if need_FC and not sos:
+        m.Bool_char_FC=en.Var(m.Time,within=en.Boolean)
+        m.Bool_dis_FC=en.Var(m.Time,within=en.Boolean,initialize=0)
+        # treated as two batts, but they cannot charge and discharge @ same time
+        m.Bool_FC_SC_dis=en.Var(m.Time,within=en.Boolean,initialize=0)
+        m.Bool_FC_SC_char=en.Var(m.Time,within=en.Boolean,initialize=0)
+        m.Bool_FC_SC_dis2=en.Var(m.Time,within=en.Boolean,initialize=0)
+        m.Bool_FC_SC_char2=en.Var(m.Time,within=en.Boolean,initialize=0)
     
     m.E_PV_grid=en.Var(m.Time,bounds=(0,None),initialize=0)
     m.E_PV_load=en.Var(m.Time,bounds=(0,None),initialize=0)
     m.E_PV_batt=en.Var(m.Time,bounds=(0,m.Batt_char_max*m.dt),initialize=0)
     m.E_PV_curt=en.Var(m.Time,bounds=(0,None),initialize=0)
     m.E_grid_load=en.Var(m.Time,bounds=(0,None),initialize=0)
-    m.E_grid_batt=en.Var(m.Time,bounds=(0,m.Batt_char_max*m.dt),
-                       initialize=0)
+    if need_grid_batt:
+        m.E_grid_batt=en.Var(m.Time,bounds=(0,m.Batt_char_max*m.dt),
+                           initialize=0)
+    else:
+        m.E_grid_batt=Zero(m.Time)
     
     #m.finalEnergyStoredValuation = en.Param(initialize = m.SOC_max_FC/2, mutable = True)
     #m.E_PV_FC=en.Var(m.Time,bounds=(0,None),initialize=0)
     #m.E_FC_load=en.Var(m.Time,bounds=(0,None),initialize=0)
-    m.E_PV_batt_FC=en.Var(m.Time,bounds=(0,m.Batt_char_max_FC*m.dt),initialize=0)
-    m.E_grid_batt_FC=en.Var(m.Time,bounds=(0,m.Batt_char_max_FC*m.dt),
-                       initialize=0)
+    if need_FC:
+        m.E_PV_batt_FC=en.Var(m.Time,bounds=(0,m.Batt_char_max_FC*m.dt),initialize=0)
+        m.E_grid_batt_FC=en.Var(m.Time,bounds=(0,m.Batt_char_max_FC*m.dt),
+                           initialize=0)
 #     m.E_FC_batt=en.Var(m.Time,bounds=(0,m.Batt_char_max_FC*m.dt),
 #                        initialize=0)
-    m.E_batt_FC=en.Var(m.Time,bounds=(0,m.Batt_dis_max_FC*m.dt),
-                       initialize=0)
+        m.E_batt_FC=en.Var(m.Time,bounds=(0,m.Batt_dis_max_FC*m.dt),
+                           initialize=0)
+    else:
+        m.E_PV_batt_FC=Zero(m.Time)
+        m.E_grid_batt_FC=Zero(m.Time)
+        m.E_batt_FC=Zero(m.Time)
 
     m.E_loss_Batt=en.Var(m.Time,bounds=(0,None),initialize=0)
-    m.E_loss_Batt_FC=en.Var(m.Time,bounds=(0,None),initialize=0)
+    m.E_loss_Batt_FC=en.Var(m.Time,bounds=(0,None),initialize=0) if need_FC else Zero(m.Time)
     #m.E_FC_downwards=en.Var(m.Time,bounds=(0,None),initialize=0)#downwards FC decreases generation
     #m.E_FC_upwards=en.Var(m.Time,bounds=(0,None),initialize=0)#upwards FC increases generation
     m.E_cons=en.Var(m.Time,bounds=(0,None),initialize=0)
@@ -133,89 +205,86 @@ def Concrete_model(Data):
     m.E_char=en.Var(m.Time,bounds=(0,m.Batt_char_max*m.dt))
     m.E_dis=en.Var(m.Time,bounds=(0,m.Batt_dis_max*m.dt))
     
-    m.E_char_FC=en.Var(m.Time,bounds=(0,m.Batt_char_max_FC*m.dt))
-    m.E_dis_FC=en.Var(m.Time,bounds=(0,m.Batt_dis_max_FC*m.dt))
+    if need_FC:
+        m.E_char_FC=en.Var(m.Time,bounds=(0,m.Batt_char_max_FC*m.dt))
+        m.E_dis_FC=en.Var(m.Time,bounds=(0,m.Batt_dis_max_FC*m.dt))
+    else:
+        m.E_char_FC=Zero(m.Time)
+        m.E_dis_FC=Zero(m.Time)
     
     m.P_max_day=en.Var(initialize=0)
     
-    m.SOC=en.Var(m.tm,bounds=(m.SOC_min,m.SOC_max),initialize=m.SOC_min)
-    m.SOC_FC=en.Var(m.tm,bounds=(m.SOC_min,m.SOC_max_FC),initialize=m.SOC_max_FC/2)
-    m.E_loss_inv_batt_FC=en.Var(m.Time,bounds=(0,None),initialize=0)
+    m.SOC=en.Var(m.tm,bounds=(m.SOC_min,m.SOC_max),initialize=en.value(m.SOC_min))
+    if need_FC:
+        m.SOC_FC=en.Var(m.tm,bounds=(m.SOC_min,m.SOC_max_FC),initialize=en.value(m.SOC_max_FC)/2)
+        m.E_loss_inv_batt_FC=en.Var(m.Time,bounds=(0,None),initialize=0)
+    else:
+        m.SOC_FC=Zero(m.tm)
+        m.E_loss_inv_batt_FC=Zero(m.Time)
     m.E_loss_conv=en.Var(m.Time,bounds=(0,None),initialize=0)
     m.E_loss_inv=en.Var(m.Time,bounds=(0,None),initialize=0)
     m.E_loss_inv_PV=en.Var(m.Time,bounds=(0,None),initialize=0)
     m.E_loss_inv_batt=en.Var(m.Time,bounds=(0,None),initialize=0)
-    m.E_loss_inv_grid=en.Var(m.Time,bounds=(0,None),initialize=0)
+    m.E_loss_inv_grid=en.Var(m.Time,bounds=(0,None),initialize=0) if need_inv else Zero(m.Time)
     #m.finalSOCmin=en.Var(initialize=m.SOC_max_FC/2)
     #Objective Function
 
     m.total_cost = en.Objective(rule=Obj_fcn,sense=en.minimize)
 
     #Constraints
-    m.cons_r=en.Constraint(m.Time,rule=Cons_rule)
+    if sos:
+        SOS_constraints(m,need_inv,need_FC)
+    else:
+        m.cons_r=en.Constraint(m.Time,rule=Cons_rule)
 
-    m.cons_ch1=en.Constraint(m.Time,rule=Bool_cons_rule_1)
-    m.cons_ch2=en.Constraint(m.Time,rule=Bool_cons_rule_2)
-    m.cons_ch3=en.Constraint(m.Time,rule=Bool_cons_rule_3)
-    m.cons_ch4=en.Constraint(m.Time,rule=Bool_cons_rule_4)
+        m.cons_ch1=en.Constraint(m.Time,rule=Bool_cons_rule_1)
+        m.cons_ch2=en.Constraint(m.Time,rule=Bool_cons_rule_2)
+        m.cons_ch3=en.Constraint(m.Time,rule=Bool_cons_rule_3)
+        m.cons_ch4=en.Constraint(m.Time,rule=Bool_cons_rule_4)
     
-    m.inv_r=en.Constraint(m.Time,rule=Bool_inv_rule0)
-
-    m.inv_ch1=en.Constraint(m.Time,rule=Bool_inv_rule_1)
-    m.inv_ch2=en.Constraint(m.Time,rule=Bool_inv_rule_2)
-    m.inv_ch3=en.Constraint(m.Time,rule=Bool_inv_rule_3)
-    m.inv_ch4=en.Constraint(m.Time,rule=Bool_inv_rule_4)
-
-    m.Batt_char_dis=en.Constraint(m.Time,rule=Batt_char_dis_rule)
-    m.Batt_ch1=en.Constraint(m.Time,rule=Bool_char_rule_1)
-    m.Batt_ch2=en.Constraint(m.Time,rule=Bool_char_rule_2)
-    m.Batt_cd3=en.Constraint(m.Time,rule=Bool_char_rule_3)
-    m.Batt_cd4=en.Constraint(m.Time,rule=Bool_char_rule_4)
+    if need_inv and not sos:
+        m.inv_r=en.Constraint(m.Time,rule=Bool_inv_rule0)
+
+        m.inv_ch1=en.Constraint(m.Time,rule=Bool_inv_rule_1)
+        m.inv_ch2=en.Constraint(m.Time,rule=Bool_inv_rule_2)
+        m.inv_ch3=en.Constraint(m.Time,rule=Bool_inv_rule_3)
+        m.inv_ch4=en.Constraint(m.Time,rule=Bool_inv_rule_4)
+
+    if not sos:
+        m.Batt_char_dis=en.Constraint(m.Time,rule=Batt_char_dis_rule)
+        m.Batt_ch1=en.Constraint(m.Time,rule=Bool_char_rule_1)
+        m.Batt_ch2=en.Constraint(m.Time,rule=Bool_char_rule_2)
+        m.Batt_cd3=en.Constraint(m.Time,rule=Bool_char_rule_3)
+        m.Batt_cd4=en.Constraint(m.Time,rule=Bool_char_rule_4)
     m.Batt_SOC=en.Constraint(m.tm,rule=def_storage_state_rule)
-    m.Balance_batt=en.Constraint(m.Time,rule=Balance_Batt_rule)
+    m.Balance_batt=en.Constraint(rule=Balance_Batt_rule)
     m.Balance_PV=en.Constraint(m.Time,rule=Balance_PV_rule)
     m.Balance_load=en.Constraint(m.Time,rule=Balance_load_rule)
     m.E_char_r=en.Constraint(m.Time,rule=E_char_rule)
     m.E_dis_r=en.Constraint(m.Time,rule=E_dis_rule)
 
-    m.Curtailment_r=en.Constraint(m.Time,rule=Curtailment_rule)
+    if (not specialized) or m.PVAC==1:
+        m.Curtailment_r=en.Constraint(m.Time,rule=Curtailment_rule)
     #m.Sold=en.Constraint(m.Time,rule=Sold_rule)# Not sure if this does sth
     m.Inverter=en.Constraint(m.Time,rule=Inverter_rule)
     m.Converter=en.Constraint(m.Time,rule=Converter_rule)
-    m.Inverter_grid=en.Constraint(m.Time,rule=Inverter_grid_rule)
+    if need_inv:
+        m.Inverter_grid=en.Constraint(m.Time,rule=Inverter_grid_rule)
     m.Grid_cons=en.Constraint(m.Time,rule=Grid_cons_rule)
     m.P_max=en.Constraint(m.Time,rule=P_max_rule)
-    m.PVSC_const=en.Constraint(m.Time,rule=PVSC_rule)
+    if not specialized:
+        m.PVSC_const=en.Constraint(m.Time,rule=PVSC_rule)
     m.Batt_losses=en.Constraint(m.Time,rule=Batt_losses_rule)
     m.Conv_losses=en.Constraint(m.Time,rule=Conv_losses_rule)
     m.Inv_losses=en.Constraint(m.Time,rule=Inv_losses_rule)
 
     m.Inv_losses_PV=en.Constraint(m.Time,rule=Inv_losses_PV_rule)
     m.Inv_losses_batt=en.Constraint(m.Time,rule=Inv_losses_Batt_rule)
-    m.Inv_losses_grid=en.Constraint(m.Time,rule=Inv_losses_Grid_rule)
-    #FC_related Constraints
-    
-    m.Batt_char_dis_FC=en.Constraint(m.Time,rule=Batt_char_dis_FC_rule)
-    m.Batt_char_dis_FC2=en.Constraint(m.Time,rule=Batt_char_dis_FC_rule2)
-    m.Batt_char_dis_FC3=en.Constraint(m.Time,rule=Batt_char_dis_FC_rule3)
-    m.Batt_ch1_FC=en.Constraint(m.Time,rule=Bool_char_rule_1_FC)
-    m.Batt_ch2_FC=en.Constraint(m.Time,rule=Bool_char_rule_2_FC)
-    m.Batt_cd3_FC=en.Constraint(m.Time,rule=Bool_char_rule_3_FC)
-    m.Batt_cd4_FC=en.Constraint(m.Time,rule=Bool_char_rule_4_FC)
-    m.Batt_ch1_FC2=en.Constraint(m.Time,rule=Bool_char_rule_1_FC2)
-    m.Batt_ch2_FC2=en.Constraint(m.Time,rule=Bool_char_rule_2_FC2)
-    m.Batt_cd3_FC2=en.Constraint(m.Time,rule=Bool_char_rule_3_FC2)
-    m.Batt_cd4_FC2=en.Constraint(m.Time,rule=Bool_char_rule_4_FC2)
-    m.Batt_ch1_FC3=en.Constraint(m.Time,rule=Bool_char_rule_1_FC3)
-    m.Batt_ch2_FC3=en.Constraint(m.Time,rule=Bool_char_rule_2_FC3)
-    m.Batt_cd3_FC3=en.Constraint(m.Time,rule=Bool_char_rule_3_FC3)
-    m.Batt_cd4_FC3=en.Constraint(m.Time,rule=Bool_char_rule_4_FC3)
-    m.Batt_SOC_FC=en.Constraint(m.tm,rule=def_storage_state_rule_FC)
-    m.Inv_losses_batt_FC=en.Constraint(m.Time,rule=Inv_losses_Batt_rule_FC)
-    m.Batt_losses_FC=en.Constraint(m.Time,rule=Batt_losses_rule_FC)
-    m.Balance_batt_FC=en.Constraint(m.Time,rule=Balance_Batt_rule_FC)
-    m.E_char_r_FC=en.Constraint(m.Time,rule=E_char_rule_FC)
-    m.E_dis_r_FC=en.Constraint(m.Time,rule=E_dis_rule_FC)
+    if need_inv:
+        m.Inv_losses_grid=en.Constraint(m.Time,rule=Inv_losses_Grid_rule)
+    if need_FC:
+        FC_constraints(m,sos)
+
     #m.final_SOC_minimum_r=en.Constraint(m.Time,rule=final_SOC_minimum_rule)
 #     m.FC_ch1=en.Constraint(m.Time,rule=Bool_cons_rule_1_FC)
 #     m.FC_ch2=en.Constraint(m.Time,rule=Bool_cons_rule_2_FC)
@@ -226,6 +295,502 @@ def Concrete_model(Data):
 #     m.E_FC_upwards_r=en.Constraint(m.Time,rule=E_FC_upwards_rule)
     return m
 
+def FC_constraints(m,sos=False):
+    '''
+    Description
+    -------
+    FC_related Constraints, the FC battery is treated as a second battery
+    which cannot charge (discharge) while the first one discharges (charges).
+    With sos the exclusivity is given by SOS_constraints.
+    '''
+    if not sos:
+        m.Batt_char_dis_FC=en.Constraint(m.Time,rule=Batt_char_dis_FC_rule)
+        m.Batt_char_dis_FC2=en.Constraint(m.Time,rule=Batt_char_dis_FC_rule2)
+        m.Batt_char_dis_FC3=en.Constraint(m.Time,rule=Batt_char_dis_FC_rule3)
+        m.Batt_ch1_FC=en.Constraint(m.Time,rule=Bool_char_rule_1_FC)
+        m.Batt_ch2_FC=en.Constraint(m.Time,rule=Bool_char_rule_2_FC)
+        m.Batt_cd3_FC=en.Constraint(m.Time,rule=Bool_char_rule_3_FC)
+        m.Batt_cd4_FC=en.Constraint(m.Time,rule=Bool_char_rule_4_FC)
+        m.Batt_ch1_FC2=en.Constraint(m.Time,rule=Bool_char_rule_1_FC2)
+        m.Batt_ch2_FC2=en.Constraint(m.Time,rule=Bool_char_rule_2_FC2)
+        m.Batt_cd3_FC2=en.Constraint(m.Time,rule=Bool_char_rule_3_FC2)
+        m.Batt_cd4_FC2=en.Constraint(m.Time,rule=Bool_char_rule_4_FC2)
+        m.Batt_ch1_FC3=en.Constraint(m.Time,rule=Bool_char_rule_1_FC3)
+        m.Batt_ch2_FC3=en.Constraint(m.Time,rule=Bool_char_rule_2_FC3)
+        m.Batt_cd3_FC3=en.Constraint(m.Time,rule=Bool_char_rule_3_FC3)
+        m.Batt_cd4_FC3=en.Constraint(m.Time,rule=Bool_char_rule_4_FC3)
+    m.Batt_SOC_FC=en.Constraint(m.tm,rule=def_storage_state_rule_FC)
+    m.Inv_losses_batt_FC=en.Constraint(m.Time,rule=Inv_losses_Batt_rule_FC)
+    m.Batt_losses_FC=en.Constraint(m.Time,rule=Batt_losses_rule_FC)
+    m.Balance_batt_FC=en.Constraint(rule=Balance_Batt_rule_FC)
+    m.E_char_r_FC=en.Constraint(m.Time,rule=E_char_rule_FC)
+    m.E_dis_r_FC=en.Constraint(m.Time,rule=E_dis_rule_FC)
+    return m
+
+def Batch_model(Datas):
+    '''
+    Description
+    -------
+    Block-diagonal instance of several dwellings with the same structure
+    (same App_comb, Tech and Set_declare): every dwelling is a block
+    m.House[h] built by Concrete_model and the objective is the sum of the
+    bills, so a single solver call optimizes all of them. The output of each
+    dwelling is obtained from its block.
+    '''
+    m=en.ConcreteModel()
+    m.Houses=en.Set(initialize=range(len(Datas)),ordered=True)
+    m.House=en.Block(m.Houses)
+    for h in m.Houses:
+        Concrete_model(Datas[h],m.House[h])
+        m.House[h].total_cost.deactivate()
+    m.total_cost=en.Objective(expr=sum(m.House[h].total_cost.expr for h in m.Houses),
+                              sense=en.minimize)
+    return m
+
+def Blocks(m):
+    '''
+    Description
+    -------
+    Dwellings of an instance, the blocks of a Batch_model or the instance.
+    '''
+    if isinstance(m,en.Block) and hasattr(m,'House'):
+        return [m.House[h] for h in m.Houses]
+    return [m]
+
+def SOS_constraints(m,need_inv,need_FC):
+    '''
+    Description
+    -------
+    Exclusivity of the flows as SOS1 sets instead of the boolean pairs with
+    big-M: the battery cannot charge and discharge, the house cannot consume
+    from and inject into the grid and the inverter cannot work in both
+    directions at the same time step. The FC battery cannot charge
+    (discharge) while the SC battery discharges (charges). The sums of flows
+    are gathered in auxiliary variables (E_inj, E_inv_in and E_inv_out).
+    Requires a solver supporting SOS1 (e.g. CPLEX, Gurobi or CBC).
+    '''
+    m.E_inj=en.Var(m.Time,bounds=(0,None),initialize=0)
+    m.E_inj_r=en.Constraint(m.Time,rule=E_inj_rule)
+    m.SOS_cons=en.SOSConstraint(m.Time,rule=SOS_cons_rule,sos=1)
+    m.SOS_batt=en.SOSConstraint(m.Time,rule=SOS_batt_rule,sos=1)
+    if need_inv:
+        m.E_inv_in=en.Var(m.Time,bounds=(0,None),initialize=0)
+        m.E_inv_out=en.Var(m.Time,bounds=(0,None),initialize=0)
+        m.E_inv_in_r=en.Constraint(m.Time,rule=E_inv_in_rule)
+        m.E_inv_out_r=en.Constraint(m.Time,rule=E_inv_out_rule)
+        m.SOS_inv=en.SOSConstraint(m.Time,rule=SOS_inv_rule,sos=1)
+    if need_FC:
+        m.SOS_batt_FC=en.SOSConstraint(m.Time,rule=SOS_batt_FC_rule,sos=1)
+        m.SOS_batt_FC2=en.SOSConstraint(m.Time,rule=SOS_batt_FC_rule2,sos=1)
+        m.SOS_batt_FC3=en.SOSConstraint(m.Time,rule=SOS_batt_FC_rule3,sos=1)
+    return m
+
+def E_inj_rule(m,i):
+    '''
+    Description
+    -------
+    Injection into the grid (PV and FC discharge), used by the SOS1 formulation.
+    '''
+    return m.E_inj[i]==m.E_PV_grid[i]+m.E_dis_FC[i]
+
+def E_inv_in_rule(m,i):
+    '''
+    Description
+    -------
+    Flows from the grid to the batteries through the inverter (AC/DC), used by
+    the SOS1 formulation.
+    '''
+    return m.E_inv_in[i]==m.E_grid_batt[i]+m.E_grid_batt_FC[i]
+
+def E_inv_out_rule(m,i):
+    '''
+    Description
+    -------
+    Flows from the DC side to the AC side of the inverter (DC/AC), used by
+    the SOS1 formulation.
+    '''
+    return m.E_inv_out[i]==m.E_PV_grid[i]+m.E_PV_load[i]+m.E_dis[i]+m.E_dis_FC[i]
+
+def SOS_cons_rule(m,i):
+    '''
+    Description
+    -------
+    The house cannot consume from and inject into the grid at the same time.
+    '''
+    return [m.E_cons[i],m.E_inj[i]]
+
+def SOS_batt_rule(m,i):
+    '''
+    Description
+    -------
+    Forbids the battery to charge and discharge at the same time.
+    '''
+    return [m.E_char[i],m.E_dis[i]]
+
+def SOS_inv_rule(m,i):
+    '''
+    Description
+    -------
+    The inverter cannot work in both directions at the same time.
+    '''
+    return [m.E_inv_in[i],m.E_inv_out[i]]
+
+def SOS_batt_FC_rule(m,i):
+    '''
+    Description
+    -------
+    Forbids the FC battery to charge and discharge at the same time.
+    '''
+    return [m.E_char_FC[i],m.E_dis_FC[i]]
+
+def SOS_batt_FC_rule2(m,i):
+    '''
+    Description
+    -------
+    The SC battery cannot charge while the FC battery discharges.
+    '''
+    return [m.E_char[i],m.E_dis_FC[i]]
+
+def SOS_batt_FC_rule3(m,i):
+    '''
+    Description
+    -------
+    The FC battery cannot charge while the SC battery discharges.
+    '''
+    return [m.E_char_FC[i],m.E_dis[i]]
+
+def Zero(s):
+    '''
+    Description
+    -------
+    Placeholder for the flows that are not created by a specialized instance.
+    '''
+    return en.Param(s,default=0)
+
+def FC_div(Data):
+    '''
+    Description
+    -------
+    Share of the battery reserved to FC. A specialized instance without FC
+    uses the whole battery for the other applications.
+    '''
+    if Data.get('specialized',False) and not Data['App_comb_mod'][0]:
+        return 0
+    return Data['FC_div']
+
+#Former big-M, used if Data['tight_M'] is False
+bigM=500000
+M_names=['M_char','M_dis','M_char_FC','M_dis_FC','M_cons','M_inj','M_inv_in',
+         'M_inv_out']
+
+def Serie(x,n):
+    '''
+    Description
+    -------
+    Time series of Data (dict or array indexed from 0 to n-1) as an array.
+    '''
+    return np.fromiter((x[i] for i in range(n)),float,n)
+
+def Indexed(x):
+    '''
+    Description
+    -------
+    Time series of Data (dict or array indexed from 0 to n-1) as a dict, as
+    needed by store_values.
+    '''
+    return x if isinstance(x,dict) else dict(enumerate(x))
+
+def Big_M(Data):
+    '''
+    Description
+    -------
+    Tightest valid big-M of the complementarity constraints for every time
+    step, derived from the variable bounds and the data of the day instead of
+    bigM=500000:
+    M_char, M_char_FC: battery charging power, PV production (Balance_PV_rule)
+    plus grid charging through the inverter (if DLS, always for FC).
+    M_dis, M_dis_FC: battery discharging power, usable SOC, Inverter_power and
+    for the SC battery the demand (Balance_load_rule).
+    M_inv_in: grid charging, limited by both batteries and Inverter_grid_rule.
+    M_cons: demand plus grid charging including inverter losses (Grid_cons_rule).
+    M_inj: PV (or Max_inj if PVAC) plus FC discharge, limited by Inverter_rule.
+    M_inv_out: PV plus both discharges, limited by Inverter_rule.
+    A tolerance of 0.1 Wh is added to avoid cutting off solutions at the
+    bounds and tiny coefficients in the matrix.
+    Returns a dict of arrays named as the M_* Params of Concrete_model.
+    If Data['tight_M'] is False the former bigM is used.
+    '''
+    n=len(Data['Set_declare'])-1
+    if not Data.get('tight_M',True):
+        return {name:np.full(n,float(bigM)) for name in M_names}
+    dt=Data['delta_t']
+    Batt=Data['Batt']
+    div=FC_div(Data)
+    ie=Data['Inverter_eff']
+    inv=Data['Inv_power']*dt
+    DLS=bool(Data['App_comb_mod'][3])
+    E_PV=Serie(Data['E_PV'],n)
+    E_demand=Serie(Data['E_demand'],n)
+    if Data['App_comb_mod'][1]:#PVAC
+        E_PV_inj=np.minimum(E_PV,Data['Max_inj']*dt)
+    else:
+        E_PV_inj=E_PV
+    char=Batt.P_max_char*(1-div)*dt
+    char_FC=Batt.P_max_char*div*dt
+    M={}
+    M['M_inv_in']=np.full(n,min(inv*ie,char*DLS+char_FC))
+    M['M_char']=np.minimum(char,np.minimum(E_PV,inv)+min(inv*ie,char)*DLS)
+    M['M_char_FC']=np.minimum(char_FC,np.minimum(E_PV,inv)+min(inv*ie,char_FC))
+    M['M_dis']=np.minimum(min(-Batt.P_max_dis*(1-div)*dt,
+                              max(Data['SOC_max']*(1-div)-Batt.SOC_min,0),inv),
+                          E_demand/ie)
+    M['M_dis_FC']=np.full(n,min(-Batt.P_max_dis*div*dt,
+                                max(Data['SOC_max']*div-Batt.SOC_min,0),inv))
+    M['M_cons']=E_demand+M['M_inv_in']/ie
+    M['M_inj']=np.minimum(inv,E_PV_inj+M['M_dis_FC'])
+    M['M_inv_out']=np.minimum(inv,E_PV+M['M_dis']+M['M_dis_FC'])
+    return {name:M[name]+1e-4 for name in M_names}
+
+def Update_model(m,Data):
+    '''
+    Description
+    -------
+    Pushes the data of a new day into an instance created by Concrete_model,
+    so the same instance can be solved again without building it from scratch.
+    Only the mutable parameters are updated, thus the structure (App_comb_mod,
+    delta_t, FC_div and the length of Set_declare) must be the one used to
+    build the instance.
+    '''
+    m.retail_price.store_values(Indexed(Data['retail_price']))
+    m.E_PV.store_values(Indexed(Data['E_PV']))
+    m.E_demand.store_values(Indexed(Data['E_demand']))
+    m.FC_price_up.store_values(Indexed(Data['FC_price_up']))
+    m.FC_price_down.store_values(Indexed(Data['FC_price_down']))
+    m.export_price.store_values(Indexed(Data['Export_price']))
+    m.capacity_tariff=Data['Capacity_tariff']
+    m.Inverter_power=Data['Inv_power']
+    m.Inverter_eff=Data['Inverter_eff']
+    m.Converter_eff=Data['Converter_Efficiency_Batt']
+    m.Max_injection=Data['Max_inj']
+    m.SOC_init=Data.get('SOC_init',Data['Batt'].SOC_min)
+    m.Efficiency=Data['Batt'].Efficiency
+
+    m.SOC_min_FC=Data['Batt'].SOC_min
+    m.SOC_max_FC=Data['SOC_max']*m.FC_div
+    m.Batt_dis_max_FC=-Data['Batt'].P_max_dis*m.FC_div
+    m.Batt_char_max_FC=Data['Batt'].P_max_char*m.FC_div
+
+    m.SOC_min=Data['Batt'].SOC_min
+    m.SOC_max=Data['SOC_max']*(1-m.FC_div)
+    m.Batt_dis_max=-Data['Batt'].P_max_dis*(1-m.FC_div)
+    m.Batt_char_max=Data['Batt'].P_max_char*(1-m.FC_div)
+
+    if hasattr(m,'M_char'):
+        M=Big_M(Data)
+        for name in M_names:
+            getattr(m,name).store_values(dict(enumerate(M[name])))
+    return m
+
+def Model_key(Data):
+    '''
+    Description
+    -------
+    Returns the parameters defining the structure of the instance. Two days
+    with the same key can share the same instance through Update_model.
+    '''
+    return (tuple(int(i) for i in Data['App_comb_mod'].values()),Data['delta_t'],
+            FC_div(Data),len(Data['Set_declare']),Data.get('specialized',False),
+            Data.get('exclusivity','bigM'))
+
+def Relax_model(m,relax=True):
+    '''
+    Description
+    -------
+    Turns an instance into its LP relaxation, i.e. without the exclusivity of
+    the flows: the booleans are fixed and the constraints containing them (or
+    the SOS1 sets) deactivated. relax=False restores the MILP. After solving
+    the relaxation Exclusivity_violations tells if the solution is also
+    optimal for the MILP.
+    '''
+    if isinstance(m,Sparse_model):
+        m.relaxed=relax
+        return m
+    for v in m.component_objects(en.Var):
+        if v.local_name.startswith('Bool'):
+            for i in v:
+                if relax:
+                    v[i].fix(0)
+                else:
+                    v[i].unfix()
+    for con in m.component_objects(en.Constraint):
+        first=next(iter(con.values()),None)
+        if first is not None and any(
+                x.parent_component().local_name.startswith('Bool')
+                for x in identify_variables(first.body)):
+            con.deactivate() if relax else con.activate()
+    for con in m.component_objects(en.SOSConstraint):
+        con.deactivate() if relax else con.activate()
+    return m
+
+def Flows(m):
+    '''
+    Description
+    -------
+    Returns a function giving the solution of a variable as an array over
+    m.Time (zeros for the flows not created by a specialized instance).
+    '''
+    if isinstance(m,Sparse_model):
+        return lambda name: m.res.x[m.col[name][-m.n:]]
+    n=len(m.Time)
+    return lambda name: np.fromiter((en.value(getattr(m,name)[i]) for i in m.Time),
+                                    float,n)
+
+def Exclusivity_violations(m,tol=1e-6):
+    '''
+    Description
+    -------
+    Number of time steps of the solution with simultaneous exclusive flows
+    (see Exclusive), e.g. charging and discharging the battery. If there are
+    none the solution of the LP relaxation is feasible, thus optimal, for the
+    MILP.
+    '''
+    violations=0
+    for b in Blocks(m):
+        value=Flows(b)
+        violated=np.zeros(len(value('E_cons')),bool)
+        for Bool_a,Bool_b,flows_a,flows_b in Exclusive:
+            violated|=((sum(value(k) for k in flows_a)>tol)
+                       &(sum(value(k) for k in flows_b)>tol))
+        violations+=int(violated.sum())
+    return violations
+
+def Set_booleans(m):
+    '''
+    Description
+    -------
+    Sets the booleans consistently with the flows of the solution, used when
+    the LP relaxation is accepted as solution of the MILP.
+    '''
+    for b in Blocks(m):
+        value=Flows(b)
+        for Bool_a,Bool_b,flows_a,flows_b in Exclusive:
+            a=(sum(value(k) for k in flows_a)>sum(value(k) for k in flows_b))*1.
+            if isinstance(b,Sparse_model):
+                b.res.x[b.col[Bool_a]]=a
+                b.res.x[b.col[Bool_b]]=1-a
+            elif isinstance(getattr(b,Bool_a,None),en.Var):
+                getattr(b,Bool_a).set_values(dict(zip(b.Time,a)))
+                getattr(b,Bool_b).set_values(dict(zip(b.Time,1-a)))
+    return m
+
+def Solution(m):
+    '''
+    Description
+    -------
+    Returns the values of the variables of an instance (or of a block) as
+    {name:array} in the order of their index (nan if not set), to be used as
+    warm start of another instance (see Warm_start).
+    '''
+    return {v.local_name:np.array([v[i].value for i in v],dtype=float)
+            for v in m.component_objects(en.Var,active=True)}
+
+def Warm_start(m,solution,tol=1e-6):
+    '''
+    Description
+    -------
+    Sets the variables of an instance (or of a block) to a previous solution
+    (see Solution), the solvers supporting warm starts take them as initial
+    incumbent. Fixed variables (e.g. booleans of Relax_model), nan values and
+    variables missing or with another number of time steps in the instance
+    are left unchanged. Returns True if the start satisfies every active
+    constraint, i.e. if the solver can accept it without repairing it.
+    '''
+    if isinstance(m,Sparse_model):
+        return False
+    for v in m.component_objects(en.Var,active=True):
+        values=solution.get(v.local_name)
+        if values is None or len(values)!=len(v):
+            continue
+        for i,x in zip(v,values):
+            if not (np.isnan(x) or v[i].fixed):
+                v[i].set_value(x,skip_validation=True)
+    for c in m.component_data_objects(en.Constraint,active=True):
+        body=en.value(c.body,exception=False)
+        if body is None:
+            return False
+        if c.has_lb() and body<en.value(c.lower)-tol:
+            return False
+        if c.has_ub() and body>en.value(c.upper)+tol:
+            return False
+    return True
+
+def Model_size(m):
+    '''
+    Description
+    -------
+    Returns the number of variables, binaries, active constraints and
+    non-zeros of an instance (or of a Sparse_model).
+    '''
+    if isinstance(m,Sparse_model):
+        return {'vars':m.nvar,'binaries':int(m.integrality.sum()),
+                'constraints':m.nrows,'nonzeros':m.A.nnz}
+    size={'vars':0,'binaries':0,'constraints':0,'nonzeros':0}
+    for v in m.component_data_objects(en.Var):
+        size['vars']+=1
+        size['binaries']+=v.is_binary()
+    for c in m.component_data_objects(en.Constraint,active=True):
+        size['constraints']+=1
+        size['nonzeros']+=len(list(identify_variables(c.body)))
+    return size
+
+def Duplicated_constraints(m):
+    '''
+    Description
+    -------
+    Model hygiene check. Returns the indexed constraints with several
+    identical rows, e.g. a rule that sums over the whole horizon but is
+    indexed over m.Time, which makes the instance grow quadratically with the
+    horizon. The result is a dict {constraint name: number of duplicated rows}.
+    '''
+    duplicated={}
+    for con in m.component_objects(en.Constraint,active=True):
+        if not con.is_indexed():
+            continue
+        rows=set()
+        for c in con.values():
+            repn=generate_standard_repn(c.body,compute_values=False)
+            rows.add((tuple(sorted(zip((id(v) for v in repn.linear_vars),
+                                       map(str,repn.linear_coefs)))),
+                      str(c.lower),str(c.upper)))
+        if len(rows)<len(con):
+            duplicated[con.name]=len(con)-len(rows)
+    return duplicated
+
+#Instances already built, see Get_model
+Templates={}
+Max_templates=16
+
+def Get_model(Data,templates=None):
+    '''
+    Description
+    -------
+    Returns an instance for Data. Instances are cached by Model_key, so an
+    instance with the same structure is updated with Update_model (e.g. a new
+    day, technology or dwelling) and only a new structure is built with
+    Concrete_model. The oldest instance is dropped when the cache is full.
+    templates replaces the cache of the module (Templates), e.g. one per
+    thread (see Core_LP.Solve_day).
+    '''
+    if templates is None:
+        templates=Templates
+    key=Model_key(Data)
+    if key in templates:
+        return Update_model(templates[key],Data)
+    if len(templates)>=Max_templates:
+        templates.pop(next(iter(templates)))
+    templates[key]=Concrete_model(Data)
+    return templates[key]
+
 #Instance
 #Energy
 def final_SOC_minimum_rule(m,i):
@@ -240,8 +805,7 @@ def Bool_char_rule_1(m,i):
     -------
     Forbids the battery to charge and discharge at the same time 1/5
     '''
-    bigM=500000
-    return((m.E_dis[i])>=-bigM*(m.Bool_dis[i]))
+    return((m.E_dis[i])>=-m.M_dis[i]*(m.Bool_dis[i]))
 
 def Bool_char_rule_2(m,i):
     '''
@@ -249,8 +813,7 @@ def Bool_char_rule_2(m,i):
     -------
     Forbids the battery to charge and discharge at the same time 2/5
     '''
-    bigM=500000
-    return((m.E_dis[i])<=0+bigM*(1-m.Bool_char[i]))
+    return((m.E_dis[i])<=0+m.M_dis[i]*(1-m.Bool_char[i]))
 
 def Bool_char_rule_3(m,i):
     '''
@@ -258,8 +821,7 @@ def Bool_char_rule_3(m,i):
     -------
     Forbids the battery to charge and discharge at the same time 3/5
     '''
-    bigM=500000
-    return((m.E_char[i])>=-bigM*(m.Bool_char[i]))
+    return((m.E_char[i])>=-m.M_char[i]*(m.Bool_char[i]))
 
 def Bool_char_rule_4(m,i):
     '''
@@ -267,8 +829,7 @@ def Bool_char_rule_4(m,i):
     -------
     Forbids the battery to charge and discharge at the same time 4/5
     '''
-    bigM=500000
-    return((m.E_char[i])<=0+bigM*(1-m.Bool_dis[i]))
+    return((m.E_char[i])<=0+m.M_char[i]*(1-m.Bool_dis[i]))
 
 def Batt_char_dis_rule(m,i):
     '''
@@ -278,11 +839,13 @@ def Batt_char_dis_rule(m,i):
     '''
     return (m.Bool_char[i]+m.Bool_dis[i],1)
 
-def Balance_Batt_rule(m,i):
+def Balance_Batt_rule(m):
     '''
     Description
     -------
     Balance of the battery charge, discharge and efficiency losses.
+    It sums over the whole horizon, thus it is a single constraint (not
+    indexed over m.Time).
     '''
     return (sum(m.E_char[i]for i in m.Time)
             -sum(m.E_dis[i]+m.E_loss_Batt[i] for i in m.Time)==0)
@@ -312,8 +875,7 @@ def Bool_char_rule_1_FC(m,i):
     -------
     Forbids the battery to charge and discharge at the same time 1/5
     '''
-    bigM=500000
-    return((m.E_dis_FC[i])>=-bigM*(m.Bool_dis_FC[i]))
+    return((m.E_dis_FC[i])>=-m.M_dis_FC[i]*(m.Bool_dis_FC[i]))
 
 def Bool_char_rule_2_FC(m,i):
     '''
@@ -321,8 +883,7 @@ def Bool_char_rule_2_FC(m,i):
     -------
     Forbids the battery to charge and discharge at the same time 2/5
     '''
-    bigM=500000
-    return((m.E_dis_FC[i])<=0+bigM*(1-m.Bool_char_FC[i]))
+    return((m.E_dis_FC[i])<=0+m.M_dis_FC[i]*(1-m.Bool_char_FC[i]))
 
 def Bool_char_rule_3_FC(m,i):
     '''
@@ -330,8 +891,7 @@ def Bool_char_rule_3_FC(m,i):
     -------
     Forbids the battery to charge and discharge at the same time 3/5
     '''
-    bigM=500000
-    return((m.E_char_FC[i])>=-bigM*(m.Bool_char_FC[i]))
+    return((m.E_char_FC[i])>=-m.M_char_FC[i]*(m.Bool_char_FC[i]))
 
 def Bool_char_rule_4_FC(m,i):
     '''
@@ -339,8 +899,7 @@ def Bool_char_rule_4_FC(m,i):
     -------
     Forbids the battery to charge and discharge at the same time 4/5
     '''
-    bigM=500000
-    return((m.E_char_FC[i])<=0+bigM*(1-m.Bool_dis_FC[i]))
+    return((m.E_char_FC[i])<=0+m.M_char_FC[i]*(1-m.Bool_dis_FC[i]))
 
 def Batt_char_dis_FC_rule(m,i):
     '''
@@ -355,8 +914,7 @@ def Bool_char_rule_1_FC2(m,i):
     -------
     Forbids the battery to charge and discharge at the same time 1/5
     '''
-    bigM=500000
-    return((m.E_dis_FC[i])>=-bigM*(m.Bool_FC_SC_dis[i]))#dis
+    return((m.E_dis_FC[i])>=-m.M_dis_FC[i]*(m.Bool_FC_SC_dis[i]))#dis
 
 def Bool_char_rule_2_FC2(m,i):
     '''
@@ -364,8 +922,7 @@ def Bool_char_rule_2_FC2(m,i):
     -------
     Forbids the battery to charge and discharge at the same time 2/5
     '''
-    bigM=500000
-    return((m.E_dis_FC[i])<=0+bigM*(1-m.Bool_FC_SC_char[i]))
+    return((m.E_dis_FC[i])<=0+m.M_dis_FC[i]*(1-m.Bool_FC_SC_char[i]))
 
 def Bool_char_rule_3_FC2(m,i):
     '''
@@ -373,8 +930,7 @@ def Bool_char_rule_3_FC2(m,i):
     -------
     Forbids the battery to charge and discharge at the same time 3/5
     '''
-    bigM=500000
-    return((m.E_char[i])>=-bigM*(m.Bool_FC_SC_char[i]))
+    return((m.E_char[i])>=-m.M_char[i]*(m.Bool_FC_SC_char[i]))
 
 def Bool_char_rule_4_FC2(m,i):
     '''
@@ -382,8 +938,7 @@ def Bool_char_rule_4_FC2(m,i):
     -------
     Forbids the battery to charge and discharge at the same time 4/5
     '''
-    bigM=500000
-    return((m.E_char[i])<=0+bigM*(1-m.Bool_FC_SC_dis[i]))
+    return((m.E_char[i])<=0+m.M_char[i]*(1-m.Bool_FC_SC_dis[i]))
 
 def Batt_char_dis_FC_rule2(m,i):
     '''
@@ -398,8 +953,7 @@ def Bool_char_rule_1_FC3(m,i):
     -------
     Forbids the battery to charge and discharge at the same time 1/5
     '''
-    bigM=500000
-    return((m.E_dis[i])>=-bigM*(m.Bool_FC_SC_dis2[i]))#dis
+    return((m.E_dis[i])>=-m.M_dis[i]*(m.Bool_FC_SC_dis2[i]))#dis
 
 def Bool_char_rule_2_FC3(m,i):
     '''
@@ -407,8 +961,7 @@ def Bool_char_rule_2_FC3(m,i):
     -------
     Forbids the battery to charge and discharge at the same time 2/5
     '''
-    bigM=500000
-    return((m.E_dis[i])<=0+bigM*(1-m.Bool_FC_SC_char2[i]))
+    return((m.E_dis[i])<=0+m.M_dis[i]*(1-m.Bool_FC_SC_char2[i]))
 
 def Bool_char_rule_3_FC3(m,i):
     '''
@@ -416,8 +969,7 @@ def Bool_char_rule_3_FC3(m,i):
     -------
     Forbids the battery to charge and discharge at the same time 3/5
     '''
-    bigM=500000
-    return((m.E_char_FC[i])>=-bigM*(m.Bool_FC_SC_char2[i]))
+    return((m.E_char_FC[i])>=-m.M_char_FC[i]*(m.Bool_FC_SC_char2[i]))
 
 def Bool_char_rule_4_FC3(m,i):
     '''
@@ -425,8 +977,7 @@ def Bool_char_rule_4_FC3(m,i):
     -------
     Forbids the battery to charge and discharge at the same time 4/5
     '''
-    bigM=500000
-    return((m.E_char_FC[i])<=0+bigM*(1-m.Bool_FC_SC_dis2[i]))
+    return((m.E_char_FC[i])<=0+m.M_char_FC[i]*(1-m.Bool_FC_SC_dis2[i]))
 
 def Batt_char_dis_FC_rule3(m,i):
     '''
@@ -435,11 +986,13 @@ def Batt_char_dis_FC_rule3(m,i):
     Forbids the battery to charge and discharge at the same time 5/5
     '''
     return (m.Bool_FC_SC_dis2[i]+m.Bool_FC_SC_char2[i],1)
-def Balance_Batt_rule_FC(m,i):
+def Balance_Batt_rule_FC(m):
     '''
     Description
     -------
     Balance of the battery charge, discharge and efficiency losses.
+    It sums over the whole horizon, thus it is a single constraint (not
+    indexed over m.Time).
     '''
     return (sum(m.E_char_FC[i]for i in m.Time)
             -sum(m.E_dis_FC[i]+m.E_loss_Batt_FC[i] for i in m.Time)==0)
@@ -490,8 +1043,7 @@ def Bool_cons_rule_1(m,i):
     -------
     Forbids the system to inject and export energy at the same time 1/5
     '''
-    bigM=500000
-    return((m.E_cons[i])>=-bigM*(m.Bool_cons[i]))
+    return((m.E_cons[i])>=-m.M_cons[i]*(m.Bool_cons[i]))
 
 def Bool_cons_rule_2(m,i):
     '''
@@ -499,8 +1051,7 @@ def Bool_cons_rule_2(m,i):
     -------
     Forbids the system to inject and export energy at the same time 2/5
     '''
-    bigM=500000
-    return((m.E_cons[i])<=0+bigM*(1-m.Bool_inj[i]))
+    return((m.E_cons[i])<=0+m.M_cons[i]*(1-m.Bool_inj[i]))
 
 def Bool_cons_rule_3(m,i):
     '''
@@ -508,8 +1059,7 @@ def Bool_cons_rule_3(m,i):
     -------
     Forbids the system to inject and export energy at the same time 3/5
     '''
-    bigM=500000
-    return((m.E_PV_grid[i]+m.E_dis_FC[i])>=-bigM*(m.Bool_inj[i]))
+    return((m.E_PV_grid[i]+m.E_dis_FC[i])>=-m.M_inj[i]*(m.Bool_inj[i]))
 
 def Bool_cons_rule_4(m,i):
     '''
@@ -517,8 +1067,7 @@ def Bool_cons_rule_4(m,i):
     -------
     Forbids the system to inject and export energy at the same time 4/5
     '''
-    bigM=500000
-    return((m.E_PV_grid[i]+m.E_dis_FC[i])<=0+bigM*(1-m.Bool_cons[i]))
+    return((m.E_PV_grid[i]+m.E_dis_FC[i])<=0+m.M_inj[i]*(1-m.Bool_cons[i]))
 
 def Cons_rule(m,i):
     '''
@@ -534,8 +1083,7 @@ def Bool_inv_rule_1(m,i):
     -------
     Forbids the system to inject and export energy at the same time 1/5
     '''
-    bigM=500000
-    return((m.E_grid_batt[i]+m.E_grid_batt_FC[i])>=-bigM*(m.Bool_inv_in[i]))
+    return((m.E_grid_batt[i]+m.E_grid_batt_FC[i])>=-m.M_inv_in[i]*(m.Bool_inv_in[i]))
 
 def Bool_inv_rule_2(m,i):
     '''
@@ -543,8 +1091,7 @@ def Bool_inv_rule_2(m,i):
     -------
     Forbids the system to inject and export energy at the same time 2/5
     '''
-    bigM=500000
-    return((m.E_grid_batt[i]+m.E_grid_batt_FC[i])<=0+bigM*(1-m.Bool_inv_out[i]))
+    return((m.E_grid_batt[i]+m.E_grid_batt_FC[i])<=0+m.M_inv_in[i]*(1-m.Bool_inv_out[i]))
 
 def Bool_inv_rule_3(m,i):
     '''
@@ -552,8 +1099,7 @@ def Bool_inv_rule_3(m,i):
     -------
     Forbids the system to inject and export energy at the same time 3/5
     '''
-    bigM=500000
-    return((m.E_PV_grid[i]+m.E_PV_load[i]+m.E_dis[i]+m.E_dis_FC[i])>=-bigM*(m.Bool_inv_out[i]))
+    return((m.E_PV_grid[i]+m.E_PV_load[i]+m.E_dis[i]+m.E_dis_FC[i])>=-m.M_inv_out[i]*(m.Bool_inv_out[i]))
 
 def Bool_inv_rule_4(m,i):
     '''
@@ -561,8 +1107,7 @@ def Bool_inv_rule_4(m,i):
     -------
     Forbids the system to inject and export energy at the same time 4/5
     '''
-    bigM=500000
-    return((m.E_PV_grid[i]+m.E_PV_load[i]+m.E_dis[i]+m.E_dis_FC[i])<=0+bigM*(1-m.Bool_inv_in[i]))#cons
+    return((m.E_PV_grid[i]+m.E_PV_load[i]+m.E_dis[i]+m.E_dis_FC[i])<=0+m.M_inv_out[i]*(1-m.Bool_inv_in[i]))#cons
 
 def Bool_inv_rule0(m,i):
     '''
@@ -614,10 +1159,10 @@ def def_storage_state_rule(m, t):
     '''
     Description
     -------
-    State of charge definition as the previous SOC plus charged electricity minus losses minus discharged electricity. Stablishes as well the initial SOC at SOC_min
+    State of charge definition as the previous SOC plus charged electricity minus losses minus discharged electricity. Stablishes as well the initial SOC at SOC_init (SOC_min unless Data['SOC_init'] is given, e.g. by a rolling horizon)
     '''
     if t==-1:
-        return(m.SOC[t],m.SOC_min)
+        return(m.SOC[t],m.SOC_init)
     else:
         return (m.SOC[t] ==m.SOC[t-1]+m.E_char[t]-m.E_dis[t]-m.E_loss_Batt[t])
 
@@ -767,4 +1312,314 @@ def Obj_fcn(m):
 
 #+(m.FC_price_up[i]*m.E_FC_upwards[i])
 
-#+(m.FC_price_down[i]*m.E_FC_downwards[i])+(m.FC_price_up[i]*m.E_FC_upwards[i]))
\ No newline at end of file
+#+(m.FC_price_down[i]*m.E_FC_downwards[i])+(m.FC_price_up[i]*m.E_FC_upwards[i]))
+
+
+###############################
+
+#Sparse backend
+
+class Sparse_model(object):
+    """
+    Alternative backend that builds the same daily MILP than Concrete_model
+    straight into scipy.sparse arrays and solves it with scipy.optimize.milp
+    (HiGHS), without building Pyomo expressions.
+    The constraint matrix only depends on the structure (see Model_key) and
+    on the efficiencies, so it is assembled once; for every new day
+    Update_model only changes the cost vector, the bounds and the right hand
+    side.
+    The "x>=-M*Bool" halves of the complementarity constraints always hold
+    since the flows are non-negative and are not emitted. The feasible region
+    is the same.
+    """
+    Vars=Vars
+    Vars_tm=['SOC','SOC_FC']
+
+    def __init__(self,Data):
+        if milp is None:
+            raise ImportError('The sparse backend requires scipy>=1.9')
+        if Data.get('exclusivity','bigM')!='bigM':
+            raise ValueError('The sparse backend only supports the bigM formulation')
+        self.key=Model_key(Data)
+        self.n=len(Data['Set_declare'])-1
+        self.dt=Data['delta_t']
+        self.App=[int(Data['App_comb_mod'][k]) for k in range(5)]
+        self.FC_div=FC_div(Data)
+        self.relaxed=False
+        #Columns of each variable, the variables indexed over m.tm include
+        #the initial state (-1) in the first position
+        self.col={}
+        k=0
+        for name in self.Vars:
+            size=self.n+1 if name in self.Vars_tm else self.n
+            self.col[name]=np.arange(k,k+size)
+            k+=size
+        self.col['P_max_day']=np.array([k])
+        self.nvar=k+1
+        self.integrality=np.zeros(self.nvar)
+        for name in self.Vars:
+            if name.startswith('Bool'):
+                self.integrality[self.col[name]]=1
+        self.coef_key=None
+        self.res=None
+        self.Update_model(Data)
+
+    def _add(self,name,terms,lo,hi,single=False):
+        """
+        Adds a block of rows, one per time step (or a single row if single),
+        terms is a list of (columns, coefficient).
+        """
+        size=1 if single else len(terms[0][0])
+        rows=self.nrows+np.arange(size)
+        slices=[]
+        for cols,coef in terms:
+            self._i.append(np.full(len(cols),rows[0]) if single else rows)
+            self._j.append(cols)
+            self._v.append(np.broadcast_to(np.asarray(coef,float),len(cols)))
+            slices.append(slice(self.nnz,self.nnz+len(cols)))
+            self.nnz+=len(cols)
+        self._lo.append(np.broadcast_to(np.asarray(lo,float),size))
+        self._hi.append(np.broadcast_to(np.asarray(hi,float),size))
+        self.rows[name]=slice(self.nrows,self.nrows+size)
+        self.nrows+=size
+        return slices
+
+    def _add_M(self,name,terms,Bool,M):
+        """
+        Adds flows<=M*(1-Bool), the coefficients of Bool and the right hand
+        side are set every day by Update_model from LP.Big_M.
+        """
+        slices=self._add(name,terms+[(Bool,0)],-np.inf,0)
+        self.M_rows.append((name,M,slices[-1]))
+
+    def _build(self,Data):
+        """
+        Assembles the constraint matrix, the order of the blocks follows
+        Concrete_model.
+        """
+        self._i,self._j,self._v,self._lo,self._hi=[],[],[],[],[]
+        self.rows={}
+        self.M_rows=[]
+        self.nrows=0
+        self.nnz=0
+        c=self.col
+        dt=self.dt
+        n=self.n
+        ie=Data['Inverter_eff']
+        ce=Data['Converter_Efficiency_Batt']
+        be=Data['Batt'].Efficiency
+        inf=np.inf
+        SOC,SOC_FC=c['SOC'],c['SOC_FC']
+
+        self._add('cons_r',[(c['Bool_inj'],1),(c['Bool_cons'],1)],1,1)
+        self._add_M('cons_ch2',[(c['E_cons'],1)],c['Bool_inj'],'M_cons')
+        self._add_M('cons_ch4',[(c['E_PV_grid'],1),(c['E_dis_FC'],1)],
+                    c['Bool_cons'],'M_inj')
+        self._add('inv_r',[(c['Bool_inv_out'],1),(c['Bool_inv_in'],1)],1,1)
+        self._add_M('inv_ch2',[(c['E_grid_batt'],1),(c['E_grid_batt_FC'],1)],
+                    c['Bool_inv_out'],'M_inv_in')
+        self._add_M('inv_ch4',[(c['E_PV_grid'],1),(c['E_PV_load'],1),(c['E_dis'],1),
+                               (c['E_dis_FC'],1)],c['Bool_inv_in'],'M_inv_out')
+        self._add('Batt_char_dis',[(c['Bool_char'],1),(c['Bool_dis'],1)],1,1)
+        self._add_M('Batt_ch2',[(c['E_dis'],1)],c['Bool_char'],'M_dis')
+        self._add_M('Batt_cd4',[(c['E_char'],1)],c['Bool_dis'],'M_char')
+        self._add('Batt_SOC_init',[(SOC[:1],1)],0,0)
+        self._add('Batt_SOC',[(SOC[1:],1),(SOC[:-1],-1),(c['E_char'],-1),
+                              (c['E_dis'],1),(c['E_loss_Batt'],1)],0,0)
+        self._add('Balance_batt',[(c['E_char'],1),(c['E_dis'],-1),
+                                  (c['E_loss_Batt'],-1)],0,0,single=True)
+        self._add('Balance_PV',[(c[k],1) for k in ['E_PV_load','E_PV_batt',
+                  'E_PV_batt_FC','E_PV_grid','E_loss_conv','E_loss_inv_PV',
+                  'E_PV_curt']],0,0)
+        self._add('Balance_load',[(c['E_PV_load'],1),(c['E_dis'],ie),
+                                  (c['E_grid_load'],1)],0,0)
+        self._add('E_char_r',[(c['E_char'],1),(c['E_PV_batt'],-1),
+                              (c['E_grid_batt'],-1)],0,0)
+        self._add('E_dis_r',[(c['E_dis'],1),(SOC[:-1],-1)],-inf,0)
+        if self.App[1]:#PVAC
+            self._add('Curtailment_r',[(c['E_PV_grid'],1/dt)],-inf,0)
+        self._add('Inverter',[(c[k],1/dt) for k in ['E_PV_grid','E_dis',
+                  'E_dis_FC','E_PV_load','E_loss_inv']],-inf,0)
+        self._add('Converter',[(c[k],1/dt) for k in ['E_PV_grid','E_PV_batt_FC',
+                  'E_PV_batt','E_PV_load','E_loss_conv']],-inf,0)
+        self._add('Inverter_grid',[(c[k],1/dt) for k in ['E_grid_batt',
+                  'E_grid_batt_FC','E_loss_inv_grid']],-inf,0)
+        self._add('Grid_cons',[(c['E_cons'],1)]+[(c[k],-1) for k in ['E_grid_batt',
+                  'E_grid_batt_FC','E_grid_load','E_loss_inv_grid']],0,0)
+        self._add('P_max',[(c['E_cons'],1/dt),(np.repeat(c['P_max_day'],n),-1)],
+                  -inf,0)
+        if not self.App[3]:#DLS
+            self._add('PVSC_const',[(c['E_grid_batt'],1)],0,0)
+        self._add('Batt_losses',[(c['E_loss_Batt'],1),(c['E_grid_batt'],-(1-be)),
+                                 (c['E_PV_batt'],-(1-be))],0,0)
+        self._add('Conv_losses',[(c['E_loss_conv'],1)]+[(c[k],-(1-ce)) for k in [
+                  'E_PV_load','E_PV_grid','E_PV_batt','E_PV_batt_FC',
+                  'E_loss_inv_PV']],0,0)
+        self._add('Inv_losses',[(c['E_loss_inv'],1)]+[(c[k],-1) for k in [
+                  'E_loss_inv_grid','E_loss_inv_batt','E_loss_inv_batt_FC',
+                  'E_loss_inv_PV']],0,0)
+        self._add('Inv_losses_PV',[(c['E_loss_inv_PV'],1)]+[(c[k],-(1-ie)/ie)
+                  for k in ['E_PV_grid','E_PV_load','E_PV_batt_FC']],0,0)
+        self._add('Inv_losses_batt',[(c['E_loss_inv_batt'],1),
+                                     (c['E_dis'],-(1-ie))],0,0)
+        self._add('Inv_losses_grid',[(c['E_loss_inv_grid'],1),
+                                     (c['E_grid_batt_FC'],-(1-ie)/ie),
+                                     (c['E_grid_batt'],-(1-ie)/ie)],0,0)
+        #FC_related Constraints
+        self._add('Batt_char_dis_FC',[(c['Bool_char_FC'],1),(c['Bool_dis_FC'],1)],1,1)
+        self._add('Batt_char_dis_FC2',[(c['Bool_FC_SC_dis'],1),
+                                       (c['Bool_FC_SC_char'],1)],1,1)
+        self._add('Batt_char_dis_FC3',[(c['Bool_FC_SC_dis2'],1),
+                                       (c['Bool_FC_SC_char2'],1)],1,1)
+        self._add_M('Batt_ch2_FC',[(c['E_dis_FC'],1)],c['Bool_char_FC'],'M_dis_FC')
+        self._add_M('Batt_cd4_FC',[(c['E_char_FC'],1)],c['Bool_dis_FC'],'M_char_FC')
+        self._add_M('Batt_ch2_FC2',[(c['E_dis_FC'],1)],c['Bool_FC_SC_char'],'M_dis_FC')
+        self._add_M('Batt_cd4_FC2',[(c['E_char'],1)],c['Bool_FC_SC_dis'],'M_char')
+        self._add_M('Batt_ch2_FC3',[(c['E_dis'],1)],c['Bool_FC_SC_char2'],'M_dis')
+        self._add_M('Batt_cd4_FC3',[(c['E_char_FC'],1)],c['Bool_FC_SC_dis2'],'M_char_FC')
+        self._add('Batt_SOC_FC_init',[(SOC_FC[:1],1)],0,0)
+        self._add('Batt_SOC_FC',[(SOC_FC[1:],1),(SOC_FC[:-1],-1),(c['E_char_FC'],-1),
+                                 (c['E_dis_FC'],1),(c['E_loss_Batt_FC'],1)],0,0)
+        self._add('Inv_losses_batt_FC',[(c['E_loss_inv_batt_FC'],1),
+                                        (c['E_dis_FC'],-(1-ie))],0,0)
+        self._add('Batt_losses_FC',[(c['E_loss_Batt_FC'],1),
+                                    (c['E_grid_batt_FC'],-(1-be)),
+                                    (c['E_PV_batt_FC'],-(1-be))],0,0)
+        self._add('Balance_batt_FC',[(c['E_char_FC'],1),(c['E_dis_FC'],-1),
+                                     (c['E_loss_Batt_FC'],-1)],0,0,single=True)
+        self._add('E_char_r_FC',[(c['E_char_FC'],1),(c['E_PV_batt_FC'],-1),
+                                 (c['E_grid_batt_FC'],-1)],0,0)
+        self._add('E_dis_r_FC',[(c['E_dis_FC'],1),(SOC_FC[:-1],-1)],-inf,0)
+
+        #The triplets are kept to update the big-M coefficients every day
+        self.Ai=np.concatenate(self._i)
+        self.Aj=np.concatenate(self._j)
+        self.Av=np.concatenate(self._v)
+        self.lo=np.concatenate(self._lo)
+        self.hi=np.concatenate(self._hi)
+        del self._i,self._j,self._v,self._lo,self._hi
+        self.coef_key=(ie,ce,be)
+
+    def Update_model(self,Data):
+        """
+        Pushes the data of a new day (costs, bounds and right hand side), the
+        matrix is only rebuilt if the efficiencies changed.
+        """
+        if self.coef_key!=(Data['Inverter_eff'],Data['Converter_Efficiency_Batt'],
+                           Data['Batt'].Efficiency):
+            self._build(Data)
+        n=self.n
+        c=self.col
+        dt=self.dt
+        ie=Data['Inverter_eff']
+        serie=lambda x: np.fromiter((x[i] for i in range(n)),float,n)
+        Batt=Data['Batt']
+        FC,PVSC,DPS=self.App[0],self.App[2],self.App[4]
+        SOC_max_FC=Data['SOC_max']*self.FC_div
+        SOC_max=Data['SOC_max']*(1-self.FC_div)
+
+        #Objective (see Obj_fcn)
+        export_price=serie(Data['Export_price'])
+        self.c=np.zeros(self.nvar)
+        self.c[c['E_cons']]=serie(Data['retail_price'])*PVSC
+        self.c[c['E_PV_grid']]=-export_price*PVSC
+        self.c[c['E_dis_FC']]=(-export_price*PVSC
+                               -serie(Data['FC_price_up'])*FC)*ie
+        self.c[c['E_grid_batt_FC']]=-serie(Data['FC_price_down'])*FC
+        self.c[c['P_max_day']]=Data['Capacity_tariff']*DPS
+
+        #Bounds
+        self.lb=np.zeros(self.nvar)
+        self.ub=np.full(self.nvar,np.inf)
+        self.ub[self.integrality==1]=1
+        self.lb[c['P_max_day']]=-np.inf
+        for k in ['E_PV_batt','E_grid_batt','E_char']:
+            self.ub[c[k]]=Batt.P_max_char*(1-self.FC_div)*dt
+        self.ub[c['E_dis']]=-Batt.P_max_dis*(1-self.FC_div)*dt
+        for k in ['E_PV_batt_FC','E_grid_batt_FC','E_char_FC']:
+            self.ub[c[k]]=Batt.P_max_char*self.FC_div*dt
+        for k in ['E_batt_FC','E_dis_FC']:
+            self.ub[c[k]]=-Batt.P_max_dis*self.FC_div*dt
+        self.lb[c['SOC']]=Batt.SOC_min
+        self.ub[c['SOC']]=SOC_max
+        self.lb[c['SOC_FC']]=Batt.SOC_min
+        self.ub[c['SOC_FC']]=SOC_max_FC
+
+        #Right hand side
+        r=self.rows
+        self.lo[r['Batt_SOC_init']]=self.hi[r['Batt_SOC_init']]=Data.get('SOC_init',
+                                                                   Batt.SOC_min)
+        self.lo[r['Batt_SOC_FC_init']]=self.hi[r['Batt_SOC_FC_init']]=SOC_max_FC/2
+        self.lo[r['Balance_PV']]=self.hi[r['Balance_PV']]=serie(Data['E_PV'])
+        self.lo[r['Balance_load']]=self.hi[r['Balance_load']]=serie(Data['E_demand'])
+        self.hi[r['E_dis_r']]=-Batt.SOC_min
+        self.hi[r['E_dis_r_FC']]=-Batt.SOC_min
+        if 'Curtailment_r' in r:
+            self.hi[r['Curtailment_r']]=Data['Max_inj']
+        for k in ['Inverter','Converter','Inverter_grid']:
+            self.hi[r[k]]=Data['Inv_power']
+        M=Big_M(Data)
+        for name,k,v in self.M_rows:
+            self.Av[v]=M[k]
+            self.hi[r[name]]=M[k]
+        self.A=sp.csr_matrix((self.Av,(self.Ai,self.Aj)),shape=(self.nrows,self.nvar))
+        return self
+
+    def solve(self,options=None):
+        """
+        Solves with scipy.optimize.milp and returns a pyomo SolverResults so
+        the status can be checked as with the Pyomo backend.
+        options are passed to milp, e.g. {'time_limit':30,'mip_rel_gap':0.01}.
+        If relaxed (see Relax_model) the LP relaxation is solved: the
+        booleans are continuous and the big-M rows are dropped.
+        """
+        integrality,hi=self.integrality,self.hi
+        if self.relaxed:
+            integrality=np.zeros_like(integrality)
+            hi=hi.copy()
+            for name,k,v in self.M_rows:
+                hi[self.rows[name]]=np.inf
+        self.res=milp(self.c,integrality=integrality,
+                      bounds=Bounds(self.lb,self.ub),
+                      constraints=LinearConstraint(self.A,self.lo,hi),
+                      options=options)
+        results=SolverResults()
+        if self.res.status==0:
+            results.solver.status=SolverStatus.ok
+            results.solver.termination_condition=TerminationCondition.optimal
+        elif self.res.status==1:
+            results.solver.status=(SolverStatus.ok if self.res.x is not None
+                                   else SolverStatus.aborted)
+            results.solver.termination_condition=TerminationCondition.maxTimeLimit
+        elif self.res.status==2:
+            results.solver.status=SolverStatus.warning
+            results.solver.termination_condition=TerminationCondition.infeasible
+        elif self.res.status==3:
+            results.solver.status=SolverStatus.warning
+            results.solver.termination_condition=TerminationCondition.unbounded
+        else:
+            results.solver.status=SolverStatus.error
+            results.solver.termination_condition=TerminationCondition.error
+        results.solver.message=self.res.message
+        if self.res.x is not None:
+            results.problem.upper_bound=self.res.fun
+        if getattr(self.res,'mip_dual_bound',None) is not None:
+            results.problem.lower_bound=self.res.mip_dual_bound
+        if getattr(self.res,'mip_node_count',None) is not None:
+            results.solver.statistics.branch_and_bound.number_of_bounded_subproblems=int(self.res.mip_node_count)
+        return results
+
+    def total_cost(self):
+        return self.res.fun
+
+    def Get_output(self):
+        """
+        Same output than Core_LP.Get_output: a DataFrame with one column per
+        variable (sorted by name, without the initial state) and P_max_day.
+        """
+        x=self.res.x
+        out={}
+        for name in sorted(self.Vars):
+            cols=self.col[name][1:] if name in self.Vars_tm else self.col[name]
+            out[name]=x[cols]
+        return [pd.DataFrame(out),x[self.col['P_max_day'][0]]]
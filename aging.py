@@ -0,0 +1,338 @@
+# -*- coding: utf-8 -*-
+## @namespace aging
+# Calendar and cycle aging of the batteries (see Core_LP.aging_day for the
+# model and its references), evaluated over arrays of days at once.
+# The Woehler curve of every technology is a closed-form numpy expression of
+# the DoD (Woehler), the capacity lost along the days is a cumulative sum of
+# the daily aging (Age_days). Core_LP ages the battery day by day while
+# optimizing through the same functions, the stored DoD of a run (aux_dict
+# ['DoD_arr']) can be aged again afterwards, e.g. with the curves of another
+# technology, or projected until the end of life (Lifetime).
+# Rainflow counts the actual cycles of a SOC trajectory instead of taking the
+# energy charged in the day as DoD, Rainflow_aging ages the battery with them
+# (see bench_aging.py for its benchmark).
+
+import numpy as np
+
+#Woehler curve of every technology, the number of cycles at a given DoD is
+#N(DoD)=exp((log(DoD)-log(a))/b)+c and the cycle aging of one cycle 1/N
+Woehler={'LTO':(771.51,-0.604,-45300),#Xalt 60Ah LTO Model F920-0006 R2=.9977
+         'LFP':(70.869,-0.54,1961.37135),#https://doi.org/10.1016/j.apenergy.2013.09.003 R2=.917
+         #SAFT Evolion (1216.7,-0.869,-289.736058) R2=.9675
+         'NCA':(1216.7,-0.869,4449.67011),#TRINA BESS
+         'NMC':(1E8,-2.168,0),#Tesla Truong et al. 2016
+         'ALA':(37403,-1.306,330.656417),#Sacred sun FCP-1000 lead carbon R2=.9983
+         'VRLA':(667.61,-.988,0),#Sonnenschein R2=0.99995
+         'test':(238.86,-0.875,4482.74484)}#R2=.961
+
+def Cycle_aging(DoD,Technology):
+    '''
+    Aging of one cycle at the given DoD (see Woehler).
+    Parameters
+    ----------
+    DoD : float or array, in ]0,1]
+    Technology : string, key of Woehler
+
+    Returns
+    -------
+    Cycle_aging_factor : float or array
+    '''
+    if Technology not in Woehler:
+        raise ValueError('No Woehler curve for %s, choose one of %s'
+                         %(Technology,list(Woehler)))
+    [a,b,c]=Woehler[Technology]
+    with np.errstate(divide='ignore'):
+        return 1/(np.exp((np.log(DoD)-np.log(a))/b)+c)
+
+def Daily_cycle_aging(DoD,Technology):
+    '''
+    Cycle aging of days with the given DoD (energy charged over the capacity).
+    A day with DoD>1 counts int(DoD) full cycles and one cycle of the rest,
+    a day without cycles is aged as a cycle of DoD 1e-5.
+    Parameters
+    ----------
+    DoD : array
+    Technology : string
+
+    Returns
+    -------
+    Cycle_aging_factor : array
+    '''
+    DoD=np.asarray(DoD,dtype=float)
+    full=np.where(DoD>1,np.floor(DoD),0)
+    rest=np.where(DoD==0,0.00001,DoD-full)
+    return Cycle_aging(rest,Technology)+full*Cycle_aging(1.,Technology)
+
+def Calendar_aging(Batt):
+    '''
+    Calendar aging of one day, a linear loss until the EoL (70% of the
+    capacity) at the end of the calendar life.
+    '''
+    return 1/(Batt.Battery_cal_life*24*365)*24
+
+def Age_days(DoD,Batt,aux_Cap=None):
+    '''
+    Ages the battery along consecutive days with the cycle aging of their DoD
+    (see Daily_cycle_aging and Age_cycles).
+    Parameters
+    ----------
+    DoD : array, DoD of every day
+    Batt : class
+    aux_Cap : float, capacity before the first day (default Batt.Capacity)
+
+    Returns
+    -------
+    see Age_cycles
+    '''
+    return Age_cycles(Daily_cycle_aging(DoD,Batt.Technology),Batt,aux_Cap)
+
+def Age_cycles(Cycle_aging_factor,Batt,aux_Cap=None):
+    '''
+    Ages the battery along consecutive days, each day the battery loses the
+    largest of its calendar and cycle aging.
+    Parameters
+    ----------
+    Cycle_aging_factor : array, cycle aging of every day
+    Batt : class
+    aux_Cap : float, capacity before the first day (default Batt.Capacity)
+
+    Returns
+    -------
+    SOC_max : array, at the end of every day
+    aux_Cap : array, capacity at the end of every day
+    SOH : array, at the beginning of every day, linearized in [0,1] (0 at the EoL)
+    Cycle_aging_factor : array
+    cycle_cal : array, 1 on the days dominated by the cycle aging
+    '''
+    if aux_Cap is None:
+        aux_Cap=Batt.Capacity
+    Cal_aging_factor=Calendar_aging(Batt)
+    aging=np.maximum(Cycle_aging_factor,Cal_aging_factor)
+    Cap=aux_Cap-0.3*Batt.Capacity*np.cumsum(aging)
+    SOH=1/.3*np.concatenate(([aux_Cap],Cap[:-1]))/Batt.Capacity-7/3
+    SOC_max=Batt.SOC_min+Cap*((Batt.SOC_max-Batt.SOC_min)/Batt.Capacity)
+    cycle_cal=(Cycle_aging_factor>Cal_aging_factor).astype(int)
+    return [SOC_max,Cap,SOH,Cycle_aging_factor,cycle_cal]
+
+def Lifetime(DoD,Batt,aux_Cap=None):
+    '''
+    Years until the EoL (70% of the capacity) repeating the DoD of the given
+    days, e.g. the DoD_arr of a one-year optimization.
+    Parameters
+    ----------
+    DoD : array
+    Batt : class
+    aux_Cap : float, capacity before the first day (default Batt.Capacity)
+
+    Returns
+    -------
+    years : float
+    '''
+    if aux_Cap is None:
+        aux_Cap=Batt.Capacity
+    aging=np.maximum(Daily_cycle_aging(DoD,Batt.Technology),Calendar_aging(Batt))
+    lost=0.3*Batt.Capacity*np.cumsum(aging)
+    left=aux_Cap-0.7*Batt.Capacity
+    if left<=0:
+        return 0.
+    [periods,rest]=divmod(left,lost[-1])
+    days=periods*len(lost)+np.searchsorted(lost,rest)+1
+    return days/365
+
+def Reversals(SOC):
+    '''
+    Indices of the turning points of a trajectory, its first and last points
+    included. Flat segments are skipped.
+    Parameters
+    ----------
+    SOC : array
+
+    Returns
+    -------
+    index : array of int
+    '''
+    SOC=np.asarray(SOC,dtype=float)
+    moves=np.flatnonzero(np.diff(SOC))
+    if len(SOC)<2 or not len(moves):
+        return np.arange(min(len(SOC),1))
+    sign=np.sign(SOC[moves+1]-SOC[moves])
+    turns=moves[np.flatnonzero(sign[1:]!=sign[:-1])+1]
+    return np.concatenate(([0],turns,[len(SOC)-1]))
+
+#The passes removing the inner cycles with array operations stop when they
+#find fewer cycles, the rest is counted on the stack (see Count_cycles)
+Min_cycles=16
+
+def Closing(points,after,ranges,bound):
+    '''
+    Point closing the cycles of Count_cycles: the cycle from a to b=points
+    [after] is closed by the first next point at ranges from b (all the points
+    in between are closer to b, they are the inner cycles removed before), as
+    the standard stack does. It is found by binary lifting over the maxima and
+    minima of the blocks of 2**l points, up to the point closing the cycle
+    once the inner cycles were removed (bound, the closing point if it is next
+    to b).
+    Parameters
+    ----------
+    points : array, reversals
+    after : array of int, position of b in points
+    ranges : array, |b-a|
+    bound : array of int, position of a point closing the cycle
+
+    Returns
+    -------
+    position : array of int
+    '''
+    position=bound.copy()
+    far=np.flatnonzero(bound>after+1)
+    if not len(far):
+        return position
+    [after,ranges,bound]=[after[far],ranges[far],bound[far]]
+    highs=[points]
+    lows=[points]
+    while 2**len(highs)<=(bound-after).max():
+        size=2**(len(highs)-1)
+        highs.append(np.maximum(highs[-1][:-size],highs[-1][size:]))
+        lows.append(np.minimum(lows[-1][:-size],lows[-1][size:]))
+    b=points[after]
+    last=after.copy()
+    for l in reversed(range(len(highs))):
+        start=last+1
+        inside=start+2**l<=bound
+        start=np.where(inside,start,0)
+        reach=(highs[l][start]-b>=ranges)|(b-lows[l][start]>=ranges)
+        last=np.where(inside&~reach,last+2**l,last)
+    position[far]=last+1
+    return position
+
+def Count_cycles(points,index):
+    '''
+    Rainflow counting (ASTM E1049) of the reversals of a trajectory. The
+    stack of the standard removes an inner cycle, a range not larger than the
+    next one and smaller than the previous one, and the start of the
+    trajectory as a half cycle if its first range is not larger than the
+    second one. The cycles found do not depend on the order of the removals:
+    every pass removes all the inner cycles of the reversals at once. Once a
+    pass finds less than Min_cycles cycles the rest (mostly the residue) goes
+    through the stack. The points closing the cycles are found afterwards
+    (see Closing).
+    Parameters
+    ----------
+    points : array, SOC at the reversals (see Reversals)
+    index : array of int, index of the reversals in the trajectory
+
+    Returns
+    -------
+    see Rainflow
+    '''
+    #cycles closed later (b: position of their second point, top: point
+    #closing them once the inner cycles were removed)
+    found=[]
+    reversals=points
+    position=np.arange(len(points))
+    while len(points)>=3:
+        r=np.abs(np.diff(points))
+        inner=np.zeros(len(r),dtype=bool)
+        inner[:-1]=r[:-1]<=r[1:]
+        inner[1:]&=r[1:]<r[:-1]
+        k=np.flatnonzero(inner)
+        if len(k)<Min_cycles:
+            break
+        full=k>0
+        found.append((r[k],np.where(full,1.,0.5),position[k+1],position[k+2]))
+        keep=np.ones(len(points),dtype=bool)
+        keep[k]=False
+        keep[k[full]+1]=False
+        [points,position]=[points[keep],position[keep]]
+    #the rest on the stack
+    values=points.tolist()
+    ranges=[]
+    counts=[]
+    b=[]
+    top=[]
+    stack=[]
+    for k in range(len(values)):
+        stack.append(k)
+        while len(stack)>=3:
+            X=abs(values[stack[-1]]-values[stack[-2]])
+            Y=abs(values[stack[-2]]-values[stack[-3]])
+            if X<Y:
+                break
+            ranges.append(Y)
+            b.append(stack[-2])
+            top.append(k)
+            if len(stack)==3:#the start of the trajectory is a half cycle
+                counts.append(0.5)
+                del stack[0]
+            else:
+                counts.append(1.)
+                del stack[-3:-1]
+    found.append((np.array(ranges),np.array(counts),position[b],position[top]))
+    [ranges,counts,b,top]=[np.concatenate(x) for x in zip(*found)]
+    #the rest are half cycles closed at their last point
+    stack=np.array(stack,dtype=int)
+    ends=np.concatenate((Closing(reversals,b,ranges,top),position[stack[1:]]))
+    ranges=np.concatenate((ranges,np.abs(np.diff(points[stack]))))
+    counts=np.concatenate((counts,np.full(max(len(stack)-1,0),0.5)))
+    order=np.argsort(ends,kind='stable')
+    return [ranges[order],counts[order],index[ends[order]]]
+
+def Rainflow(SOC):
+    '''
+    Rainflow counting (ASTM E1049) of a SOC trajectory, e.g. the SOC+SOC_FC
+    of a whole year, over its reversals (see Reversals and Count_cycles).
+    Parameters
+    ----------
+    SOC : array
+
+    Returns
+    -------
+    ranges : array, energy of every cycle (same unit as SOC)
+    counts : array, 1 for full cycles and 0.5 for half cycles
+    ends : array of int, index of SOC where every cycle is closed, the
+        cycles are sorted by ends
+    '''
+    index=Reversals(SOC)
+    return Count_cycles(np.asarray(SOC,dtype=float)[index],index)
+
+def Rainflow_aging(SOC,Batt,steps_day,aux_Cap=None):
+    '''
+    Ages the battery with the cycles of a SOC trajectory (see Rainflow), the
+    DoD of every cycle is its range over the capacity and every cycle ages
+    the battery on the day it is closed.
+    Parameters
+    ----------
+    SOC : array, steps_day time steps per day
+    Batt : class
+    steps_day : int
+    aux_Cap : float, capacity before the first day (default Batt.Capacity)
+
+    Returns
+    -------
+    see Age_cycles
+    '''
+    [ranges,counts,ends]=Rainflow(SOC)
+    days=-(-len(SOC)//steps_day)
+    Cycle_aging_factor=np.bincount(ends//steps_day,minlength=days,
+        weights=counts*Cycle_aging(ranges/Batt.Capacity,Batt.Technology))
+    return Age_cycles(Cycle_aging_factor,Batt,aux_Cap)
+
+def Rainflow_batch(SOCs,Batts,steps_day):
+    '''
+    Rainflow_aging of many stored runs, e.g. the SOC+SOC_FC columns of the
+    outputs of a sweep. The runs are counted one by one, the arrays of one
+    year stay in the cache (counting all the runs in the same arrays is
+    slower).
+    Parameters
+    ----------
+    SOCs : list of arrays
+    Batts : list of class, or one battery for all the runs
+    steps_day : int
+
+    Returns
+    -------
+    list of the outputs of Age_cycles
+    '''
+    if not isinstance(Batts,(list,tuple)):
+        Batts=[Batts]*len(SOCs)
+    return [Rainflow_aging(SOC,Batt,steps_day) for SOC,Batt in zip(SOCs,Batts)]
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+## @namespace bench_LP
+# Regression benchmarks of the optimization model.
+# Builds the LP instance for horizons from one day to one month at 15-minute
+# and 1-hour resolution and reports its size and build time. The size must
+# grow linearly with the number of time steps, i.e. no rule indexed over
+# m.Time may sum over the whole horizon (see LP.Duplicated_constraints).
+# The script exits with an error if the model size grows faster than linearly.
+# bench_formulation compares the solve times of the big-M and SOS1
+# formulations of the exclusive flows (see LP.Concrete_model) for every
+# App_comb with a solver supporting SOS1 (see solvers.Registry).
+# Usage: python bench_LP.py [formulation [solver]]
+
+import sys
+import time
+import itertools
+import pyomo.environ as en
+import paper_classes as pc
+import LP
+import solvers
+
+batt = pc.Battery_tech(Capacity=7,Technology='NMC')
+
+def bench_data(n,dt=0.25,App_comb=(1,0,1,1,1)):
+    '''
+    Synthetic Data dictionary of n time steps, similar to mwe.py.
+    '''
+    steps_day=int(24/dt)
+    hour=lambda t: (t%steps_day)*dt
+    return {'Set_declare':list(range(-1,n)),
+            'delta_t':dt,
+            'App_comb_mod':dict(enumerate(App_comb)),
+            'retail_price':{t:0.25 if 7<=hour(t)<20 else 0.15 for t in range(n)},
+            'E_PV':{t:dt if 8<=hour(t)<=16 else 0. for t in range(n)},
+            'E_demand':{t:0.5*dt for t in range(n)},
+            'Export_price':{t:0.05 for t in range(n)},
+            'FC_price_up':{t:0.06 for t in range(n)},
+            'FC_price_down':{t:0.04 for t in range(n)},
+            'Capacity_tariff':0.3,
+            'Inv_power':4,
+            'Inverter_eff':0.95,
+            'Converter_Efficiency_Batt':0.98,
+            'Max_inj':4.8,
+            'Batt':batt,
+            'SOC_max':batt.SOC_max,
+            'FC_div':0.25}
+
+def bench_size(horizons=(1,2,7,30),resolutions=(0.25,1),tolerance=0.05):
+    '''
+    Builds the instance for every horizon (days) and resolution (hours) and
+    checks that constraints and non-zeros per time step stay constant.
+    '''
+    ok=True
+    print('%8s %6s %8s %8s %9s %9s %8s'%('dt','days','steps','vars',
+          'cons','nonzeros','build_s'))
+    for dt in resolutions:
+        per_step=[]
+        for days in horizons:
+            n=int(days*24/dt)
+            t0=time.time()
+            m=LP.Concrete_model(bench_data(n,dt))
+            t1=time.time()-t0
+            size=LP.Model_size(m)
+            per_step.append((size['constraints']/n,size['nonzeros']/n))
+            print('%8s %6s %8s %8s %9s %9s %8.2f'%(dt,days,n,size['vars'],
+                  size['constraints'],size['nonzeros'],t1))
+        for k in range(2):
+            growth=max(p[k] for p in per_step)/min(p[k] for p in per_step)
+            if growth>1+tolerance:
+                print('Model size grows faster than linearly (x%.2f per step)'%growth)
+                ok=False
+    duplicated=LP.Duplicated_constraints(LP.Concrete_model(bench_data(96)))
+    if duplicated:
+        print('Duplicated constraints:',duplicated)
+        ok=False
+    return ok
+
+def bench_formulation(solver='auto',days=1,dt=0.25,
+                      formulations=('bigM','sos1'),tolerance=1e-6):
+    '''
+    Solves one instance per App_comb (PVSC always active) with every
+    formulation of the exclusive flows and reports the solve times. Checks
+    that all the formulations reach the same objective.
+    '''
+    ok=True
+    n=int(days*24/dt)
+    print('%12s'%'App_comb'+''.join('%12s %9s'%(f,'obj') for f in formulations))
+    for App in itertools.product([0,1],[0,1],[1],[0,1],[0,1]):
+        line='%12s'%''.join(str(a) for a in App)
+        obj=[]
+        for f in formulations:
+            m=LP.Concrete_model(dict(bench_data(n,dt,App),exclusivity=f))
+            opt=solvers.Solver(solver)
+            t0=time.time()
+            opt.solve(m)
+            obj.append(en.value(m.total_cost))
+            line+='%12.3f %9.4f'%(time.time()-t0,obj[-1])
+        if max(obj)-min(obj)>tolerance*max(1,abs(obj[0])):
+            line+=' objective mismatch'
+            ok=False
+        print(line)
+    return ok
+
+if __name__== '__main__':
+    if len(sys.argv)>1 and sys.argv[1]=='formulation':
+        ok=bench_formulation(*sys.argv[2:3])
+    else:
+        ok=bench_size()
+    sys.exit(0 if ok else 1)
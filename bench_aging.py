@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+## @namespace bench_aging
+# Benchmark of the rainflow counting of aging.py.
+# Counts the cycles of synthetic annual SOC trajectories (35040 steps of 15
+# minutes) with aging.Rainflow and with a step by step pure Python reference,
+# checks that both find the same cycles and reports the times per run and for
+# a batch of runs (see aging.Rainflow_batch).
+# The script exits with an error if the cycles differ.
+# Usage: python bench_aging.py [runs]
+
+import sys
+import time
+import numpy as np
+import paper_classes as pc
+import aging
+
+def bench_SOC(days=365,dt=0.25,Capacity=7,seed=0):
+    '''
+    Synthetic SOC of a battery charged at noon and discharged in the evening,
+    with noise (e.g. frequency control) and flat periods.
+    '''
+    rng=np.random.default_rng(seed)
+    steps_day=int(24/dt)
+    hour=np.arange(days*steps_day)%steps_day*dt
+    depth=np.repeat(rng.uniform(0.2,0.9,days),steps_day)
+    SOC=depth*np.clip(np.sin((hour-8)/12*np.pi),0,None)
+    SOC+=np.where(rng.random(len(SOC))<0.3,rng.normal(0,0.02,len(SOC)),0)
+    return Capacity*np.clip(SOC,0,1)
+
+def reference_rainflow(SOC):
+    '''
+    Step by step rainflow counting, the reversals are found in the same loop.
+    '''
+    ranges=[]
+    counts=[]
+    stack=[]
+    def push(x):
+        stack.append(x)
+        while len(stack)>=3:
+            X=abs(stack[-1]-stack[-2])
+            Y=abs(stack[-2]-stack[-3])
+            if X<Y:
+                break
+            ranges.append(Y)
+            if len(stack)==3:
+                counts.append(0.5)
+                del stack[0]
+            else:
+                counts.append(1.)
+                del stack[-3:-1]
+    last=SOC[0]
+    direction=0
+    push(SOC[0])
+    for x in SOC[1:]:
+        if x==last:
+            continue
+        d=1 if x>last else -1
+        if direction and d!=direction:
+            push(last)
+        direction=d
+        last=x
+    if len(SOC)>1:
+        push(SOC[-1])
+    for k in range(len(stack)-1):
+        ranges.append(abs(stack[k+1]-stack[k]))
+        counts.append(0.5)
+    return [np.array(ranges),np.array(counts)]
+
+def bench_rainflow(runs=100,days=365,dt=0.25):
+    '''
+    Times aging.Rainflow against the reference for one run and
+    aging.Rainflow_batch (counting and aging) against the reference counting
+    for runs runs.
+    '''
+    ok=True
+    SOC=bench_SOC(days,dt)
+    t0=time.time()
+    [ranges,counts]=reference_rainflow(SOC.tolist())
+    t_ref=time.time()-t0
+    t0=time.time()
+    [ranges_,counts_,ends]=aging.Rainflow(SOC)
+    t_new=time.time()-t0
+    #the cycles closed by the same point may come in another order
+    order=np.lexsort((counts,ranges))
+    order_=np.lexsort((counts_,ranges_))
+    if not (len(ranges)==len(ranges_) and np.allclose(ranges[order],ranges_[order_])
+            and np.array_equal(counts[order],counts_[order_])):
+        print('Rainflow differs from the reference')
+        ok=False
+    print('%i steps, %i cycles: reference %.3f s, aging.Rainflow %.3f s (x%.1f)'
+          %(len(SOC),counts.sum(),t_ref,t_new,t_ref/t_new))
+    Batt=pc.Battery_tech(Capacity=7,Technology='NMC')
+    SOCs=[bench_SOC(days,dt,seed=k) for k in range(runs)]
+    t0=time.time()
+    for SOC in SOCs:
+        reference_rainflow(SOC.tolist())
+    t_ref=time.time()-t0
+    t0=time.time()
+    aged=aging.Rainflow_batch(SOCs,Batt,int(24/dt))
+    t_new=time.time()-t0
+    print('%i runs: reference counting %.2f s, aged with aging.Rainflow_batch %.2f s (x%.1f)'
+          %(runs,t_ref,t_new,t_ref/t_new))
+    print('SOH after %i days %.4f-%.4f'%(days,min(a[2][-1] for a in aged),
+                                         max(a[2][-1] for a in aged)))
+    return ok
+
+if __name__== '__main__':
+    ok=bench_rainflow(*[int(a) for a in sys.argv[1:2]])
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+## @namespace input_store
+# Columnar binary store of the input files (load profiles of the dwellings,
+# PV generation and prices, see Main.load_param).
+# Parsing the whole csv of a country for every combination dominates the
+# start of the tasks. Convert writes the csv once to a directory next to it
+# (same name without extension) with one .npy file per column, the time index
+# already localized (index.npy, UTC datetime64) and its timezone (tz.txt).
+# Load_input then reads only the requested columns, it falls back to the csv
+# if the store has not been written.
+# The columns shared by all the dwellings of a country (PV and prices, see
+# Common) are memory-mapped once per process (Map_common) and given as
+# read-only views, the processes share the pages of the files. Main maps them
+# before starting its pool and the workers inherit the maps, only the demand
+# of the dwelling is read for every combination.
+# Usage: python input_store.py CH|US
+
+import os
+import sys
+import numpy as np
+import pandas as pd
+from pathlib import Path
+
+#csv, timezone and shift of the index of every country (see Localize)
+Countries={'CH':(Path("../../Input/IRES_CH_all2.csv"),'Europe/Brussels',None),
+           'US':(Path("../../Input/IRES_US_all.csv"),'US/Central','06:00:00')}
+#Columns shared by all the dwellings of a country
+Common=['E_PV','Price_flat','Price_DT','Price_flat_mod','Price_DT_mod',
+        'Export_price','FC_price_up','FC_price_down']
+#Index and common columns of the countries mapped by the process
+Mapped={}
+
+def Store_path(filename):
+    '''
+    Directory of the store of a csv.
+    '''
+    return Path(filename).with_suffix('')
+
+def Localize(index,tz,shift=None):
+    '''
+    Converts the index of the csv to the timezone of the country, the index
+    is in UTC. If it is not parsed as dates, the string index is converted
+    and shifted by shift (the US files).
+    '''
+    if np.issubdtype(index.dtype, np.datetime64):
+        return index.tz_localize('UTC').tz_convert(tz)
+    index=pd.to_datetime(index,utc=True).tz_convert(tz)
+    if shift is not None:
+        index=index+pd.Timedelta(shift)
+    return index
+
+def Read_csv(country,columns=None):
+    '''
+    Parses the csv of a country.
+    Parameters
+    ----------
+    country : string, key of Countries
+    columns : list, columns to read (all if None)
+
+    Returns
+    -------
+    df : DataFrame with the localized time index
+    '''
+    [filename,tz,shift]=Countries[country]
+    usecols=None if columns is None else lambda c: c=='index' or c in columns
+    df = pd.read_csv(filename,engine='python',sep=',|;',index_col=[0],
+                     parse_dates=[0],usecols=usecols)
+    df.index=Localize(df.index,tz,shift)
+    return df
+
+def Convert(country):
+    '''
+    Writes the store of a country from its csv.
+    '''
+    [filename,tz,shift]=Countries[country]
+    df=Read_csv(country)
+    store=Store_path(filename)
+    os.makedirs(store,exist_ok=True)
+    for col in df.columns:
+        np.save(store/('%s.npy'%col),df[col].to_numpy(dtype=float))
+    np.save(store/'index.npy',
+            df.index.tz_convert('UTC').tz_localize(None).values.astype('datetime64[ns]'))
+    with open(store/'tz.txt','w') as f:
+        f.write(tz)
+    print('%i columns of %s written to %s'%(df.shape[1],filename,store))
+
+def Prepare(country):
+    '''
+    Writes the store of a country if it does not exist and maps its common
+    columns (see Map_common), e.g. before starting a pool of workers.
+    '''
+    if not os.path.exists(Store_path(Countries[country][0])/'index.npy'):
+        Convert(country)
+    Map_common(country)
+
+def Map_common(country):
+    '''
+    Index and memory-mapped common columns of the store of a country, mapped
+    once per process.
+    Returns
+    -------
+    index : DatetimeIndex, localized
+    common : dict of read-only arrays
+    '''
+    if country not in Mapped:
+        store=Store_path(Countries[country][0])
+        with open(store/'tz.txt') as f:
+            tz=f.read().strip()
+        index=pd.DatetimeIndex(np.load(store/'index.npy'),name='index')
+        index=index.tz_localize('UTC').tz_convert(tz)
+        Mapped[country]=[index,{col:np.load(store/('%s.npy'%col),mmap_mode='r')
+                                for col in Common
+                                if os.path.exists(store/('%s.npy'%col))}]
+    return Mapped[country]
+
+def Load_input(country,columns):
+    '''
+    Reads the columns of the input of a country from its store, or from the
+    csv if there is no store. The common columns are views of the mapped
+    files (see Map_common), they are read-only.
+    Parameters
+    ----------
+    country : string, key of Countries
+    columns : list, e.g. the dwelling, E_PV and the prices
+
+    Returns
+    -------
+    df : DataFrame with the localized time index
+    '''
+    store=Store_path(Countries[country][0])
+    if not os.path.exists(store/'index.npy'):
+        return Read_csv(country,columns)
+    [index,common]=Map_common(country)
+    return pd.DataFrame({col:common[col] if col in common
+                         else np.load(store/('%s.npy'%col)) for col in columns},
+                        index=index,copy=False)
+
+if __name__== '__main__':
+    for country in sys.argv[1:] or list(Countries):
+        Convert(country)
@@ -1,5 +1,5 @@
 import pyomo.environ as en
-from pyomo.opt import SolverFactory
+import solvers
 import paper_classes as pp
 import LP as LP
 
@@ -43,8 +43,9 @@ Data = {
 # It is assumed that the provided script with Concrete_model and all constraints is in scope.
 model = LP.Concrete_model(Data)
 
-# Create and run the solver (using GLPK as an example)
-solver = SolverFactory('gurobi')
+# Create and run the solver, the first one installed (see solvers.Registry),
+# e.g. solvers.Solver('highs') to choose it
+solver = solvers.Solver('auto')
 result = solver.solve(model, tee=True)
 result.write(num=1)
 
@@ -22,13 +22,33 @@ import os
 import pandas as pd
 import numpy as np
 import itertools
+from types import MappingProxyType
+
+#App combinations [PVCT, PVAC, PVSC, DLS, DPS] (PVSC always active) by App
+#index, as in the App_comb table of get_table_inputs, and the App index of
+#every combination
+App_combs=tuple(tuple(bool(x) for x in np.insert(c,2,True))
+                for c in itertools.product([False, True],repeat=4))
+App_index=MappingProxyType({c:i for i,c in enumerate(App_combs)})
+#Tables of get_table_inputs, read once per process
+Tables=[]
 
 def get_table_inputs():
+    '''
+    Dwellings of the clusters, PV sizes and App combinations. The tables are
+    read once per process (the workers of Main inherit them), copies are
+    returned.
+    '''
+    if not Tables:
+        Tables.extend(read_table_inputs())
+    return [table.copy() for table in Tables]
+
+def read_table_inputs():
     clusters=pd.read_csv('/data/home/alejandropena/P4/Sept_2021/Input/clusters.csv',index_col=[0])
-    aux=pd.DataFrame()
     print('inside table 2')
-    for i in range(9):
-            aux=aux.append(clusters.loc[(clusters.country=='CH')&(clusters.cluster==i)][:(min(30,clusters.loc[(clusters.country=='CH')&(clusters.cluster==i),'name'].size))])
+    #the first 30 CH dwellings of every cluster
+    aux=pd.concat([clusters.loc[(clusters.country=='CH')&(clusters.cluster==i)][:30]
+                   for i in range(9)])
 
 
     PV=[{'PV':3.2,'quartile':25,'country':'US'},
@@ -274,14 +294,8 @@ def get_main_results(dict_res,clusters,PV,App):
     agg_results['P_drained_max']=df['E_cons'].max()/dt
     agg_results['P_injected_max']=df.loc[:,['E_PV_grid','E_batt_FC']].sum(axis=1).max()/dt
     
-    if isinstance(dict_res['App_comb'], np.ndarray):
-        print('is np')
-        App_=App.App_index[App.App_comb==str(dict_res['App_comb'])[1:-1].replace("  "," ").strip()].values
-        agg_results['App_comb']=App_[0]
-    elif isinstance(dict_res['App_comb'], list):
-        print('is list')
-        App_=App.App_index[App.App_comb==str(dict_res['App_comb'])[1:-1].replace("  "," ").replace(',','')].values
-        agg_results['App_comb']=App_[0]
+    App_=App_index[tuple(bool(x) for x in dict_res['App_comb'])]
+    agg_results['App_comb']=App_
     
     agg_results['Capacity']=dict_res['Capacity']
 
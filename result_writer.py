@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+## @namespace result_writer
+# Single process writing the outputs of the workers of Main: the aggregated
+# results (see results_store) and the schedules and pickles of every run (see
+# Core_LP.save_results).
+# The workers send (kind, payload) items through a multiprocessing queue
+# (Send), the item is pickled at once (a payload that cannot be pickled
+# raises in the worker and later changes of the payload are not sent) and
+# put returns without waiting for the disk. The writer gathers the items in
+# batches: the aggregated rows of a batch are inserted in one transaction and
+# every file is written to a temporary file and renamed, a file is complete
+# or absent. A transaction failing (e.g. the database is locked) is tried
+# again, the rows and the files that still cannot be written are appended to
+# Spool and written again by Replay (e.g. at the start of Main.main).
+# Without writer (e.g. a single run calling Core_LP.single_opt2) Send writes
+# at once in the calling process.
+
+import os
+import time
+import pickle
+import sqlite3
+import multiprocessing as mp
+from queue import Empty
+from pathlib import Path
+import results_store
+
+#Queue of the writer in the workers (see Init), None without writer
+Queue=None
+#Tries of a transaction and seconds before the first retry (doubled at every try)
+Tries=5
+Retry_wait=1.
+#Items that could not be written, appended as pickles
+Spool=Path('../../Output/unwritten_results.pkl')
+
+def Start():
+    '''
+    Starts the writer process.
+    Returns
+    -------
+    queue : multiprocessing.Queue, to give to the workers (see Init)
+    process : multiprocessing.Process
+    '''
+    queue=mp.Queue()
+    process=mp.Process(target=Run,args=(queue,),name='result_writer')
+    process.start()
+    return [queue,process]
+
+def Stop(queue,process):
+    '''
+    Waits until the writer has written all the items sent.
+    '''
+    queue.put(None)
+    process.join()
+
+def Init(queue):
+    '''
+    Initializer of the pool workers, the items are sent to the writer.
+    '''
+    global Queue
+    Queue=queue
+
+def Send(kind,payload):
+    '''
+    Sends an output to the writer, or writes it if there is no writer.
+    Parameters
+    ----------
+    kind : string, 'aggregated' (row of results_store), 'csv' (filename,
+        DataFrame) or 'pickle' (filename, object)
+    payload : pickled at once, the payload can be modified afterwards
+    '''
+    if Queue is None:
+        Write([(kind,payload)])
+    else:
+        Queue.put(pickle.dumps((kind,payload),pickle.HIGHEST_PROTOCOL))
+
+def Run(queue,size=100,wait=0.5):
+    '''
+    Loop of the writer process: gathers up to size items (waiting at most
+    wait seconds for the next one) and writes them, until None is received.
+    '''
+    stop=False
+    while not stop:
+        items=[queue.get()]
+        while len(items)<size and items[-1] is not None:
+            try:
+                items.append(queue.get(timeout=wait))
+            except Empty:
+                break
+        stop=items[-1] is None
+        loaded=[]
+        for item in items:
+            if item is not None:
+                try:
+                    loaded.append(pickle.loads(item))
+                except Exception as e:
+                    print('The writer could not read an item: %r'%e)
+        Write(loaded)
+
+def Insert(rows):
+    '''
+    Inserts aggregated rows in one transaction (see results_store.Insert),
+    tried again Tries times if SQLite fails (e.g. the database is locked).
+    '''
+    for k in range(Tries):
+        try:
+            results_store.Insert(rows)
+            return
+        except sqlite3.OperationalError:
+            if k==Tries-1:
+                raise
+            time.sleep(Retry_wait*2**k)
+
+def Write_file(kind,payload):
+    '''
+    Writes a csv or pickle item to a temporary file renamed once complete.
+    '''
+    [filename,obj]=payload
+    tmp='%s.%i.tmp'%(filename,os.getpid())
+    try:
+        if kind=='csv':
+            obj.to_csv(tmp)
+        else:
+            with open(tmp,'wb') as f:
+                pickle.dump(obj,f,pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp,filename)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+def Write(items):
+    '''
+    Writes a batch of items (see Send), the aggregated rows in one transaction
+    and every file atomically. If the transaction fails for another reason
+    than SQLite itself (e.g. a wrong value) the rows are inserted one by one.
+    The rows and files failing are spooled (see Save_spool).
+    '''
+    rows=[payload for kind,payload in items if kind=='aggregated']
+    failed=[]
+    if rows:
+        try:
+            Insert(rows)
+        except sqlite3.OperationalError as e:
+            print('The writer could not insert %i rows: %r'%(len(rows),e))
+            failed+=[('aggregated',row) for row in rows]
+        except Exception as e:
+            print('The writer could not insert %i rows: %r'%(len(rows),e))
+            for row in rows:
+                try:
+                    Insert([row])
+                except Exception:
+                    failed.append(('aggregated',row))
+    for kind,payload in items:
+        if kind=='aggregated':
+            continue
+        try:
+            Write_file(kind,payload)
+        except Exception as e:
+            print('The writer could not write %s: %r'%(payload[0],e))
+            failed.append((kind,payload))
+    if failed:
+        Save_spool(failed)
+
+def Save_spool(items):
+    '''
+    Appends items that could not be written to Spool.
+    '''
+    try:
+        with open(Spool,'ab') as f:
+            for item in items:
+                pickle.dump(item,f,pickle.HIGHEST_PROTOCOL)
+        print('%i items spooled to %s'%(len(items),Spool))
+    except Exception as e:
+        print('%i items lost, they could not be spooled: %r'%(len(items),e))
+
+def Replay():
+    '''
+    Writes the items of Spool, the ones failing again are spooled again.
+    '''
+    if not Spool.exists():
+        return
+    tmp=Spool.with_name('%s.%i.tmp'%(Spool.name,os.getpid()))
+    os.replace(Spool,tmp)
+    items=[]
+    with open(tmp,'rb') as f:
+        while True:
+            try:
+                items.append(pickle.load(f))
+            except EOFError:
+                break
+            except Exception as e:#e.g. the writer killed while spooling
+                print('The end of %s could not be read: %r'%(Spool,e))
+                break
+    Write(items)
+    os.remove(tmp)
+    print('%i spooled items written again'%len(items))
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+## @namespace results_store
+# SQLite store of the aggregated results, one row per combination (see
+# post_proc.get_main_results and Core_LP.aggregate_results), replacing
+# aggregated_results.csv.
+# The combination (Key) is the primary key of the table: a combination
+# optimized again replaces its row and Remaining finds the combinations of a
+# grid not done yet through the index, without reading the results. The rows
+# are inserted in transactions, the database is in WAL mode so the workers
+# can write while Main reads.
+# The columns are the ones of the aggregated results, new ones are added when
+# they first appear. Import_csv loads a former aggregated_results.csv and
+# Export writes the table to a csv for the post-processing.
+
+import numbers
+import sqlite3
+import numpy as np
+import pandas as pd
+from pathlib import Path
+
+#Database of the aggregated results
+Database=Path('../../Output/aggregated_results.db')
+#Key of a combination and its SQL type
+Key={'App_comb':'INTEGER','Tech':'TEXT','name':'TEXT','country':'TEXT',
+     'cases':'TEXT','FC_div':'REAL','Scenario':'TEXT'}
+
+def Connect(database=None):
+    '''
+    Opens the database and creates the results table if needed.
+    '''
+    conn=sqlite3.connect(str(database or Database),timeout=60)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('CREATE TABLE IF NOT EXISTS results (%s, PRIMARY KEY (%s))'
+                 %(', '.join('"%s" %s'%(k,t) for k,t in Key.items()),
+                   ', '.join('"%s"'%k for k in Key)))
+    return conn
+
+def Value(x):
+    '''
+    Value of an aggregated result for SQLite, arrays and lists are stored as
+    text as in the csv.
+    '''
+    if x is None or isinstance(x,str):
+        return x
+    if isinstance(x,(bool,np.bool_,numbers.Integral)):
+        return int(x)
+    if isinstance(x,numbers.Real):
+        return float(x)
+    return str(x)
+
+def Key_value(k,x):
+    '''
+    Value of the key column k, the dwellings are stored by name as text.
+    '''
+    if x is None or (isinstance(x,float) and np.isnan(x)):
+        return None
+    if k=='name':
+        if isinstance(x,numbers.Real) and float(x).is_integer():
+            x=int(x)
+        return str(x)
+    return Value(x)
+
+def Insert(rows,database=None):
+    '''
+    Inserts (or replaces) the aggregated results of combinations in one
+    transaction.
+    Parameters
+    ----------
+    rows : list of dict or Series, containing the columns of Key
+    database : path, default Database
+    '''
+    rows=[dict(row) for row in rows]
+    names=list(Key)+sorted(set().union(*rows)-set(Key))
+    conn=Connect(database)
+    try:
+        with conn:
+            existing={c[1] for c in conn.execute('PRAGMA table_info(results)')}
+            for name in names:
+                if name not in existing:
+                    conn.execute('ALTER TABLE results ADD COLUMN "%s"'%name)
+            conn.executemany('INSERT OR REPLACE INTO results (%s) VALUES (%s)'
+                             %(', '.join('"%s"'%n for n in names),
+                               ', '.join('?'*len(names))),
+                             [[Key_value(n,row.get(n)) if n in Key
+                               else Value(row.get(n)) for n in names]
+                              for row in rows])
+    finally:
+        conn.close()
+
+def Remaining(grid,database=None):
+    '''
+    Combinations of the grid without results.
+    Parameters
+    ----------
+    grid : DataFrame, one combination per row (see Main.expand_grid)
+    database : path, default Database
+
+    Returns
+    -------
+    grid : DataFrame, rows of the grid not done
+    '''
+    conn=Connect(database)
+    try:
+        conn.execute('CREATE TEMP TABLE grid (i INTEGER, %s)'
+                     %', '.join('"%s"'%k for k in Key))
+        conn.executemany('INSERT INTO grid VALUES (%s)'%', '.join('?'*(len(Key)+1)),
+                         [[i]+[Key_value(k,row.get(k)) for k in Key]
+                          for i,row in enumerate(grid.to_dict('records'))])
+        todo=[i for (i,) in conn.execute(
+              'SELECT g.i FROM grid g LEFT JOIN results r ON %s WHERE r.rowid IS NULL'
+              %' AND '.join('r."%s" IS g."%s"'%(k,k) for k in Key))]
+    finally:
+        conn.close()
+    return grid.iloc[sorted(todo)]
+
+def Import_csv(filename,database=None):
+    '''
+    Loads an aggregated_results.csv (former format) into the database.
+    '''
+    df=pd.read_csv(filename,sep=';|,',engine='python',index_col=None).drop_duplicates()
+    df=df.astype(object).where(df.notna(),None)
+    Insert(df.to_dict('records'),database)
+    print('%i results of %s imported'%(df.shape[0],filename))
+
+def Export(filename,database=None):
+    '''
+    Writes the results to a csv (same format as aggregated_results.csv).
+    '''
+    conn=Connect(database)
+    try:
+        df=pd.read_sql('SELECT * FROM results',conn)
+    finally:
+        conn.close()
+    df.to_csv(filename,sep=';',index=False)
@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+## @namespace solvers
+# Registry of the MILP solvers used to optimize the daily dispatch (see
+# Core_LP.Optimize_batch).
+# Every solver is reached through the fastest Pyomo interface installed,
+# in-memory interfaces (appsi, direct) are preferred to the shell interfaces
+# writing LP files, except for CPLEX: the python package of cplex_direct is
+# often the size-limited Community Edition while the executable of the shell
+# interface is licensed. The interfaces of the commercial solvers are only
+# used if they solve a model above the limits of the free editions
+# (Licensed), else the next one is tried.
+# The appsi interfaces are persistent: when the same instance is solved again
+# (param['persistent']=True, see LP.Get_model) only the modified parameters
+# are sent to the solver.
+# The common options (threads, relative MIP gap and time limit) are
+# translated to the option names of every interface.
+# The solver is selected with param['solver'] (default 'auto', i.e. the first
+# available in Order), e.g. param['solver']='highs' to run without a
+# commercial license. Available() lists the solvers found.
+
+import os
+import sys
+import pyomo.environ as en
+from pyomo.opt import SolverStatus, TerminationCondition
+
+#Former CPLEX installation of the linux servers, used if present
+CPLEX_exe=('/opt/ibm/ILOG/CPLEX_Studio1271/cplex/bin/x86-64_linux/cplex')
+
+#Pyomo interfaces of every solver by order of preference and the names of
+#their threads, mipgap and time_limit options. The appsi interfaces take the
+#gap and the time limit from their config (None). CPLEX repairs the MIP starts
+#violating the constraints (repair, the number of tries is Repair_tries)
+Registry={'cplex':[('cplex',{'threads':'threads','mipgap':'mipgap',
+                             'time_limit':'TimeLimit',
+                             'repair':'mip_limits_repairtries'}),
+                   ('cplex_direct',{'threads':'threads',
+                                    'mipgap':'mip_tolerances_mipgap',
+                                    'time_limit':'timelimit',
+                                    'repair':'mip_limits_repairtries'})],
+          'gurobi':[('appsi_gurobi',{'threads':'Threads','mipgap':None,
+                                     'time_limit':None}),
+                    ('gurobi_direct',{'threads':'Threads','mipgap':'MIPGap',
+                                      'time_limit':'TimeLimit'}),
+                    ('gurobi',{'threads':'Threads','mipgap':'MIPGap',
+                               'time_limit':'TimeLimit'})],
+          'highs':[('appsi_highs',{'threads':'threads','mipgap':None,
+                                   'time_limit':None})],
+          'cbc':[('appsi_cbc',{'threads':'threads','mipgap':None,
+                               'time_limit':None}),
+                 ('cbc',{'threads':'threads','mipgap':'ratioGap',
+                         'time_limit':'seconds'})],
+          'glpk':[('glpk',{'threads':None,'mipgap':'mipgap',
+                           'time_limit':'tmlim'})]}
+#Preference of param['solver']='auto'
+Order=['cplex','gurobi','highs','cbc','glpk']
+#Tries of CPLEX to repair an infeasible MIP start
+Repair_tries=5
+#Solvers with size-limited free editions (CPLEX Community Edition: 1000
+#variables and constraints, Gurobi restricted license: 2000) and the size of
+#the model checking their license (see Licensed)
+Limited=['cplex','gurobi']
+Probe_size=2500
+#License of every interface checked by the process
+Licenses={}
+
+def Factory(interface,executable=None):
+    '''
+    Description
+    -----------
+    Creates the pyomo solver of the interface, returns None if it is not
+    installed (or not licensed).
+    '''
+    if executable is None and interface=='cplex' and sys.platform!='win32'\
+       and os.path.exists(CPLEX_exe):
+        executable=CPLEX_exe
+    try:
+        if executable is None:
+            opt=en.SolverFactory(interface)
+        else:
+            opt=en.SolverFactory(interface,executable=executable)
+        if opt.available(exception_flag=False):
+            return opt
+    except Exception:
+        pass
+    return None
+
+def Licensed(opt,interface):
+    '''
+    Description
+    -----------
+    Checks that the interface of a size-limited solver (see Limited) solves a
+    LP of Probe_size variables and constraints, i.e. that it is not a free
+    edition. The result is kept for the process.
+    '''
+    if interface not in Licenses:
+        m=en.ConcreteModel()
+        m.x=en.Var(range(Probe_size),bounds=(0,1))
+        m.c=en.Constraint(range(Probe_size),
+                          rule=lambda m,i: m.x[i]+m.x[(i+1)%Probe_size]>=1)
+        m.obj=en.Objective(expr=sum(m.x.values()))
+        try:
+            results=opt.solve(m)
+            if interface.startswith('appsi'):
+                Licenses[interface]=True
+            else:
+                Licenses[interface]=(results.solver.termination_condition
+                                     ==TerminationCondition.optimal)
+        except Exception:
+            Licenses[interface]=False
+    return Licenses[interface]
+
+def Usable(name,interface,executable=None):
+    '''
+    Description
+    -----------
+    Creates the pyomo solver of the interface of the solver name, returns
+    None if it is not installed or if it is a free edition (see Licensed).
+    '''
+    opt=Factory(interface,executable)
+    if opt is not None and name in Limited and not Licensed(opt,interface):
+        print('%s is a size-limited free edition'%interface)
+        return None
+    return opt
+
+def Available():
+    '''
+    Description
+    -----------
+    Returns the names of the solvers of the registry that can be used.
+    '''
+    return [name for name in Order if any(Usable(name,interface) is not None
+            for interface,options in Registry[name])]
+
+class Solver(object):
+    """
+    Solver of the registry with the common options already set.
+    solve(instance) has the same results as pyomo's opt.solve(instance), the
+    status is SolverStatus.ok whenever a solution has been loaded (also if
+    the time limit was reached).
+
+    Parameters
+    ----------
+    name : string, key of Registry or 'auto'
+    mipgap : float, relative MIP gap
+    time_limit : float, seconds
+    threads : int
+    executable : string, path of the solver (shell interfaces only)
+    """
+    def __init__(self,name='auto',mipgap=0.01,time_limit=30,threads=1,
+                 executable=None):
+        names=Order if name=='auto' else [name]
+        if any(n not in Registry for n in names):
+            raise ValueError('Unknown solver %s, choose one of %s or auto'
+                             %(name,list(Registry)))
+        self.opt=None
+        for n in names:
+            for interface,options in Registry[n]:
+                self.opt=Usable(n,interface,executable)
+                if self.opt is not None:
+                    break
+            if self.opt is not None:
+                break
+        if self.opt is None and name!='auto':
+            #a free edition chosen explicitly, e.g. for small instances
+            for interface,options in Registry[name]:
+                self.opt=Factory(interface,executable)
+                if self.opt is not None:
+                    break
+        if self.opt is None:
+            raise RuntimeError('No solver available for %s, install one of %s'
+                               %(name,names))
+        self.name=n
+        self.interface=interface
+        self.appsi=interface.startswith('appsi')
+        self.time_limit=time_limit
+        self.warm_start=self.opt.warm_start_capable()
+        #infeasible starts are repaired by the solver (see Core_LP.Set_start)
+        self.repair_start=options.get('repair') is not None
+        if self.repair_start:
+            self.opt.options[options['repair']]=Repair_tries
+        if threads is not None and options['threads'] is not None:
+            self.opt.options[options['threads']]=threads
+        if self.appsi:
+            self.opt.config.mip_gap=mipgap
+        else:
+            self.opt.options[options['mipgap']]=mipgap
+            self.opt.options[options['time_limit']]=time_limit
+
+    def solve(self,instance,warmstart=False,**kwargs):
+        '''
+        Description
+        -----------
+        Solves the instance (a pyomo model), kwargs are passed to the solve
+        of the interface (e.g. tee=True). With warmstart=True the current
+        values of the variables are given as initial solution if the
+        interface supports it (see LP.Warm_start).
+        '''
+        if warmstart and self.warm_start:
+            kwargs['warmstart']=True
+        if not self.appsi:
+            results=self.opt.solve(instance,**kwargs)
+            self.Set_nodes(results)
+            return results
+        #appsi raises if asked to load a solution that does not exist and
+        #reports a time limit as aborted, the solution is loaded here
+        results=self.opt.solve(instance,timelimit=self.time_limit,
+                               load_solutions=False,**kwargs)
+        if results.problem.sense==1:
+            feasible=results.problem.upper_bound
+        else:
+            feasible=results.problem.lower_bound
+        if feasible is not None and abs(feasible)!=float('inf'):
+            self.opt.load_vars()
+            if (results.solver.termination_condition
+                ==TerminationCondition.maxTimeLimit):
+                results.solver.status=SolverStatus.ok
+        self.Set_nodes(results)
+        return results
+
+    def Set_nodes(self,results):
+        '''
+        Description
+        -----------
+        Reports the branch and bound nodes of the last solve in
+        results.solver.statistics (see Core_LP.Telemetry_record), for the
+        in-memory interfaces of CPLEX, Gurobi and HiGHS.
+        '''
+        model=getattr(self.opt,'_solver_model',None)
+        try:
+            if self.name=='highs':
+                nodes=model.getInfo().mip_node_count
+            elif self.name=='cplex':
+                nodes=model.solution.progress.get_num_nodes_processed()
+            elif self.name=='gurobi':
+                nodes=model.NodeCount
+            else:
+                return
+        except Exception:
+            return
+        results.solver.statistics.branch_and_bound.number_of_bounded_subproblems=int(nodes)